@@ -0,0 +1,180 @@
+#coding=utf-8
+from __future__ import print_function, division, unicode_literals
+import os
+import re
+import sys
+import json
+import codecs
+import threading
+
+SAMPLE_SIZE = 1 << 16  # 每个样本的字节数（64K）
+SAMPLES = 4  # 大文件在开头、结尾和中间均匀取样的个数
+CHARDET_BYTES = 1 << 14  # 每个样本交给chardet的字节数，chardet是纯python的，很慢
+NON_ASCII = re.compile(b'[\x80-\xff]')
+# 没装chardet时依次试解码的编码，只看开头的样本；latin-1总能解码，放在最后
+FALLBACKS = ('gb18030', 'big5', 'shift_jis', 'euc-kr', 'latin-1')
+SUPERSETS = {'gb2312': 'gb18030', 'gbk': 'gb18030'}  # chardet常把GBK报成GB2312
+# 各BOM对应的明确了字节序的编码，utf-32-le的BOM以utf-16-le的开头，先判断
+BOMS = ((codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF32_LE, 'utf-32-le'),
+        (codecs.BOM_UTF32_BE, 'utf-32-be'), (codecs.BOM_UTF16_LE, 'utf-16-le'),
+        (codecs.BOM_UTF16_BE, 'utf-16-be'))
+# 各文件判断出的编码的缓存，按路径、大小、修改时间和inode确认文件没变，重复运行
+# 和多文件统计时直接使用；环境变量WORDCOUNTER_CODING_CACHE为空时不保存到磁盘
+CACHE = os.environ.get('WORDCOUNTER_CODING_CACHE', os.path.join(
+    os.path.expanduser('~'), '.cache', 'wordcounter', 'codings.json'))
+CACHE_ENTRIES = 10000  # 缓存最多保存的文件数
+
+_cache = None  # {绝对路径: [大小, 修改时间, inode, 编码]}，用到时才从CACHE读入
+_dirty = False  # 有没有还没保存的新结果
+_lock = threading.Lock()  # 线程池中的多个线程共用一个缓存
+
+def split_bom(head, coding=None):
+    '''以head开头的数据带与编码coding相符的BOM时，返回(明确了字节序的编码, BOM)，
+    coding为None时只看BOM；不带BOM的utf-16/32按本机字节序（与Python解码时相同），
+    其他返回(coding, b'')。分段统计时各段分开解码，只有开头的一段有BOM，所以要用
+    明确了字节序的编码，并从BOM之后开始统计
+    >>> split_bom(codecs.BOM_UTF16_BE + b'\\x00a', 'utf-16')
+    ('utf-16-be', b'\\xfe\\xff')
+    >>> split_bom(b'abc', 'gbk')
+    ('gbk', b'')
+    '''
+    name = codecs.lookup(coding).name if coding else None
+    for bom, explicit in BOMS:
+        if head.startswith(bom) and name in (None, explicit, explicit[:6],
+                                             explicit + '-sig'):
+            return explicit, bom
+    if name in ('utf-16', 'utf-32'):
+        return '{}-{}'.format(name, 'le' if sys.byteorder == 'little' else 'be'), b''
+    return coding, b''
+
+def valid_utf8(data, head=True):
+    '''data是不是合法的utf-8：不是开头的样本先跳过被截断的字的后续字节，
+    结尾被截断的字不算错'''
+    if not head:
+        i = 0
+        while i < 3 and i < len(data) and 0x80 <= data[i] < 0xc0:
+            i += 1
+        data = data[i:]
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(data, False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def detect_samples(samples):
+    '''根据从文件各处取的样本（第一个是文件开头）判断编码：先看BOM，再看是不是
+    ASCII或合法的utf-8，都不是时才导入chardet；判断不出时返回None。带BOM时返回
+    明确了字节序的编码（utf-16-le等），BOM的字节数见split_bom，分段统计时
+    各段才能分开解码'''
+    coding, bom = split_bom(samples[0])
+    if bom:
+        return coding
+    if all(valid_utf8(s, i == 0) for i, s in enumerate(samples)):
+        return 'utf-8'  # 全是ASCII时也用utf-8，没取样的地方可能有非ASCII的字
+    try:
+        import chardet
+    except ImportError:
+        for coding in FALLBACKS:
+            try:
+                codecs.getincrementaldecoder(coding)().decode(samples[0], False)
+            except UnicodeDecodeError:
+                continue
+            return coding
+        return None
+    # 只含ASCII的部分对判断编码没有帮助，反而会让chardet误判，所以每个样本都从
+    # 第一个非ASCII字节开始取
+    starts = [(s, NON_ASCII.search(s)) for s in samples]
+    data = b''.join(s[m.start():m.start() + CHARDET_BYTES] 
+                    for s, m in starts if m)
+    coding = chardet.detect(data)['encoding']
+    return SUPERSETS.get((coding or '').lower(), coding)
+
+def detect_coding(data):
+    '''判断一段字节data的编码，data较大时只在其中均匀取SAMPLES个样本
+    >>> detect_coding('中文'.encode('utf-8')), detect_coding(b'abc')
+    ('utf-8', 'utf-8')
+    >>> detect_coding(codecs.BOM_UTF16_LE + 'abc'.encode('utf-16-le'))
+    'utf-16-le'
+    >>> detect_coding(codecs.BOM_UTF32_BE + 'abc'.encode('utf-32-be'))
+    'utf-32-be'
+    '''
+    if len(data) <= SAMPLE_SIZE * SAMPLES:
+        return detect_samples([data])
+    step = (len(data) - SAMPLE_SIZE) // (SAMPLES - 1)
+    return detect_samples([data[i*step:i*step+SAMPLE_SIZE]
+                           for i in range(SAMPLES)])
+
+def read_samples(fn):
+    '''从文件fn的开头、结尾和中间均匀地读取样本，小文件整个读入作为一个样本'''
+    size = os.path.getsize(fn)
+    with open(fn, 'rb') as f:
+        if size <= SAMPLE_SIZE * SAMPLES:
+            return [f.read()]
+        samples, step = [], (size - SAMPLE_SIZE) // (SAMPLES - 1)
+        for i in range(SAMPLES):
+            f.seek(i * step)
+            samples.append(f.read(SAMPLE_SIZE))
+        return samples
+
+def detect_file(fn, opener=None):
+    '''判断文件fn的编码，结果按文件的标识缓存；opener不为None时（压缩文件）用它
+    打开文件，只能从解压后的开头读取样本；判断不出时返回None'''
+    st = os.stat(fn)
+    key, identity = os.path.abspath(fn), [st.st_size, st.st_mtime_ns, st.st_ino]
+    cache = load_cache()
+    if key in cache and cache[key][:3] == identity:
+        return cache[key][3]
+    if opener is None:
+        coding = detect_samples(read_samples(fn))
+    else:
+        with opener(fn, 'rb') as f:
+            coding = detect_coding(f.read(SAMPLE_SIZE * SAMPLES))
+    if coding is not None:
+        global _dirty
+        with _lock:
+            load_cache()[key] = identity + [coding]
+            _dirty = True
+    return coding
+
+def load_cache():
+    global _cache
+    if _cache is None:
+        _cache = {}
+        if CACHE and os.path.isfile(CACHE):
+            try:
+                with open(CACHE, 'rb') as f:
+                    _cache = json.loads(f.read().decode('utf-8'))
+            except (IOError, OSError, ValueError):
+                pass  # 缓存坏了就当没有
+    return _cache
+
+def save_cache():
+    '''把新判断出的编码保存到CACHE：先与磁盘上的缓存（可能被其他进程更新过）合并，
+    写临时文件再替换；超出CACHE_ENTRIES时丢掉最早的'''
+    with _lock:
+        _save_cache()
+
+def _save_cache():
+    global _cache, _dirty
+    if not (CACHE and _dirty):
+        return
+    new, _cache = _cache, None
+    cache = load_cache()
+    cache.update(new)
+    for k in list(cache)[:max(len(cache) - CACHE_ENTRIES, 0)]:
+        del cache[k]
+    try:
+        dirname = os.path.dirname(CACHE)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        tmp = '{}.{}.tmp'.format(CACHE, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(cache, ensure_ascii=False).encode('utf-8'))
+        os.replace(tmp, CACHE)
+    except (IOError, OSError):
+        pass  # 缓存只是为了快，写不了也不影响统计
+    _dirty = False
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
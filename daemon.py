@@ -0,0 +1,168 @@
+#coding=utf-8
+from __future__ import print_function, division, unicode_literals
+import io
+import os
+import sys
+import json
+import signal
+import socket
+import asyncio
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import cpu_count
+
+# 常驻服务监听的Unix socket，可用环境变量WORDCOUNTER_SOCKET指定
+SOCKET = os.environ.get('WORDCOUNTER_SOCKET', os.path.join(
+    tempfile.gettempdir(), 'wordcounter-{}.sock'.format(os.getuid())))
+MAX_JOBS = 4  # 同时进行的统计数
+MAX_QUEUE = 64  # 排队等待的统计数，再多就直接回复busy
+LIMIT = 1 << 20  # 一个请求最多的字节数
+
+def warm_up():
+    '''进程池启动时预先导入统计用到的模块，第一个统计不用再等'''
+    import wordcounter
+    try:
+        import chardet
+    except ImportError:
+        pass
+
+class Server(object):
+    '''常驻的统计服务：在Unix socket path上接收统计请求，所有统计共用一个预先启动好
+    的有workers个进程的进程池，省去每次启动进程、导入模块的时间。
+    协议为每行一个json：请求{"argv": 命令行参数, "cwd": 客户端的当前目录}，回复
+    {"output": 原本打印到终端上的内容, "stats": 各阶段耗时}（命令行中有--stats=json
+    时才有stats）或{"error": 错误信息}。
+    最多同时统计max_jobs个，另有max_queue个排队，再多的请求直接回复
+    {"error": "busy"}，不让请求无限堆积
+    '''
+    def __init__(self, path=SOCKET, workers=None, max_jobs=MAX_JOBS,
+                 max_queue=MAX_QUEUE):
+        self.path = path
+        self.workers = int(workers or cpu_count())
+        self.max_jobs, self.max_queue = int(max_jobs), int(max_queue)
+        self.jobs = 0  # 正在统计和排队的请求数
+        self.executor = self.new_executor()
+        # 每个统计在这里的一个线程中分段、合并，分段任务交给self.executor
+        self.threads = ThreadPoolExecutor(self.max_jobs)
+        self.server = None
+
+    def new_executor(self):
+        executor = ProcessPoolExecutor(self.workers, initializer=warm_up)
+        for f in [executor.submit(int) for _ in range(self.workers)]:
+            f.result()  # 先把进程都启动起来
+        return executor
+
+    def count(self, request):
+        '''在线程中完成一个统计请求，返回回复'''
+        from wordcounter import WordCounter, parse_args
+        from_file, to_file, args, stats = parse_args(request['argv'],
+                                                     request.get('cwd'))
+        if from_file == '-':
+            raise ValueError('Standard input cannot be sent to the server')
+        args['quiet'] = True
+        w = WordCounter(from_file, to_file, executor=self.executor, **args)
+        out = io.StringIO()
+        try:
+            w.run(out)
+        except BrokenProcessPool:  # 有进程意外退出，换一个新的进程池
+            self.executor = self.new_executor()
+            raise
+        res = {'output': out.getvalue()}
+        if stats:
+            res['stats'] = w.stats.as_dict()
+        return res
+
+    async def handle(self, reader, writer):
+        try:
+            line = await reader.readline()
+            if self.jobs >= self.max_jobs + self.max_queue:
+                res = {'error': 'busy'}
+            else:
+                self.jobs += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    res = await loop.run_in_executor(
+                        self.threads, self.count, json.loads(line.decode('utf-8')))
+                except Exception as e:
+                    res = {'error': '{}: {}'.format(type(e).__name__, e)}
+                finally:
+                    self.jobs -= 1
+        except ValueError:  # 请求超过了LIMIT
+            res = {'error': 'Request too large'}
+        writer.write(json.dumps(res, ensure_ascii=False).encode('utf-8') + b'\n')
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass  # 客户端已经走了
+        writer.close()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)  # 上次没有正常退出留下的
+        self.server = await asyncio.start_unix_server(self.handle, self.path,
+                                                      limit=LIMIT)
+        os.chmod(self.path, 0o600)  # 只有自己能用
+
+    async def serve_forever(self):
+        '''一直服务到收到SIGINT或SIGTERM'''
+        await self.start()
+        stop, loop = asyncio.Event(), asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        async with self.server:
+            await stop.wait()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.threads.shutdown(wait=False)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def forward(argv, cwd=None, path=SOCKET):
+    '''把命令行参数argv交给常驻服务统计，返回回复；没有服务在运行时返回None
+    >>> forward(['a.txt'], path='/nonexistent/wordcounter.sock') is None
+    True
+    '''
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except (IOError, OSError):  # 服务已经退出，只剩下socket文件
+            return None
+        request = {'argv': list(argv), 'cwd': cwd or os.getcwd()}
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    finally:
+        sock.close()
+    if not line:
+        return {'error': 'Server closed the connection'}
+    return json.loads(line.decode('utf-8'))
+
+def serve(argv):
+    '''命令行中的serve子命令：--workers=进程数 --max_jobs=同时统计数
+    --max_queue=排队数 --socket=路径'''
+    opts = {'workers': None, 'max_jobs': MAX_JOBS, 'max_queue': MAX_QUEUE,
+            'socket': SOCKET}
+    for i in argv:
+        k, _, v = i.lstrip('-').partition('=')
+        if k not in opts:
+            raise ValueError('Unknown option: {}'.format(i))
+        opts[k] = v
+    server = Server(opts['socket'], opts['workers'], opts['max_jobs'],
+                    opts['max_queue'])
+    print('Serving on {} with {} workers'.format(server.path, server.workers),
+          file=sys.stderr)
+    try:
+        asyncio.run(server.serve_forever())
+    finally:
+        server.close()
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
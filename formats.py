@@ -0,0 +1,88 @@
+#coding=utf-8
+from __future__ import print_function, division, unicode_literals
+import json
+import struct
+
+FORMATS = ('text', 'tsv', 'jsonl', 'bin')  # 结果文件的格式
+BIN_MAGIC = b'WCNT\x01'  # bin格式的文件头，最后一个字节为版本号
+RECORD = struct.Struct('<IQ')  # bin格式每条记录的头：键的字节数、频数
+
+def write_counts(f, items, fmt='text', coding='utf-8', name=None):
+    '''把按频数排好序的(键, 频数)逐条写入以二进制方式打开的文件f，不在内存中拼接
+    整个结果。各格式为：
+    text   每行"键: 频数"，用coding编码，与WordCounter.result相同
+    tsv    每行"键\\t频数"，utf-8编码
+    jsonl  每行一个{"key": 键, "count": 频数}，utf-8编码
+    bin    文件头BIN_MAGIC后每条记录为RECORD加上utf-8编码的键，可用read_bin读回
+    name不为None时表示这是多文件统计中文件name的结果，text和tsv写成以"# name"
+    开头的一节，jsonl在每条记录中加上"file"，bin格式只写总结果
+    '''
+    if fmt == 'text':
+        sep = '\n\n# {}\n'.format(name) if name is not None else ''
+        for k, n in items:
+            f.write('{}{}: {}'.format(sep, k, n).encode(coding))
+            sep = '\n'
+    elif fmt == 'tsv':
+        if name is not None:
+            f.write('# {}\n'.format(name).encode('utf-8'))
+        f.writelines('{}\t{}\n'.format(k, n).encode('utf-8') for k, n in items)
+    elif fmt == 'jsonl':
+        extra = {} if name is None else {'file': name}
+        f.writelines((json.dumps(dict(extra, key=k, count=n), ensure_ascii=False)
+                      + '\n').encode('utf-8') for k, n in items)
+    elif fmt == 'bin':
+        if name is not None:
+            return
+        f.write(BIN_MAGIC)
+        for k, n in items:
+            key = k.encode('utf-8')
+            f.write(RECORD.pack(len(key), n))
+            f.write(key)
+    else:
+        raise ValueError('Unknown format: {}'.format(fmt))
+
+def read_bin(f):
+    '''逐条读出write_counts以bin格式写入文件f的(键, 频数)'''
+    if f.read(len(BIN_MAGIC)) != BIN_MAGIC:
+        raise ValueError('Not a wordcounter bin file: 文件格式不对')
+    while True:
+        head = f.read(RECORD.size)
+        if not head:
+            break
+        size, n = RECORD.unpack(head)
+        yield f.read(size).decode('utf-8'), n
+
+PARTIAL_MAGIC = b'WCNP'  # 部分统计文件的文件头
+PARTIAL_VERSION = 1
+HEADER = struct.Struct('<BI')  # 版本号、其后json格式的统计设置的字节数
+
+def write_partial(f, items, meta):
+    '''把按键排序的(键, 频数)写成可合并的部分统计文件（map/reduce中map的输出）：
+    文件头为PARTIAL_MAGIC、版本号及统计设置meta（mode、n等，合并时要一致），
+    之后每条记录与bin格式相同；按键排序，所以多个文件可以流式归并'''
+    head = json.dumps(meta, sort_keys=True).encode('utf-8')
+    f.write(PARTIAL_MAGIC + HEADER.pack(PARTIAL_VERSION, len(head)) + head)
+    for k, n in items:
+        key = k.encode('utf-8')
+        f.write(RECORD.pack(len(key), n))
+        f.write(key)
+
+def read_partial_meta(f):
+    '''读出部分统计文件f的统计设置，读完后f停在第一条记录处'''
+    if f.read(len(PARTIAL_MAGIC)) != PARTIAL_MAGIC:
+        raise ValueError('Not a wordcounter partial file: 文件格式不对')
+    version, size = HEADER.unpack(f.read(HEADER.size))
+    if version != PARTIAL_VERSION:
+        raise ValueError('Unsupported partial file version: {}'.format(version))
+    return json.loads(f.read(size).decode('utf-8'))
+
+def read_partial(path):
+    '''按键的顺序逐条读出部分统计文件path中的(键, 频数)'''
+    with open(path, 'rb') as f:
+        read_partial_meta(f)
+        while True:
+            head = f.read(RECORD.size)
+            if not head:
+                break
+            size, n = RECORD.unpack(head)
+            yield f.read(size).decode('utf-8'), n
@@ -0,0 +1,70 @@
+#coding=utf-8
+from __future__ import print_function, division, unicode_literals
+import os
+import sys
+import time
+import threading
+from multiprocessing import Value
+from utils import humansize, humantime
+
+INTERVAL = 0.5  # 进度每隔多少秒刷新一次
+STEP = 1 << 20  # 逐行统计时，每处理这么多字节才累加一次共享计数器（1M）
+
+def report(done, n):
+    '''把处理完的字节数n累加到所有进程共享的计数器done上'''
+    with done.get_lock():
+        done.value += n
+
+class Progress(object):
+    '''所有进程的总体进度：各进程把处理完的字节数累加到共享计数器done上（见report），
+    主进程中只有一个线程每隔interval秒读一次done，显示进度、速度和剩余时间，
+    统计本身不做任何格式化和终端输出
+    just like:
+    a.txt, 50.0% [=====     ] 512 M/1 G 85.3 MB/s [00:06<00:06]
+    total为None时（流式输入）不知道总大小，只显示已处理的字节数和速度
+    '''
+    def __init__(self, total=None, name='', interval=INTERVAL, out=None):
+        self.done = Value('q', 0)
+        self.total = total
+        self.name = os.path.basename(name)
+        self.interval = interval
+        self.out = out or sys.stderr
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start = time.time()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.render()
+        self.out.write('\33[?25h\n')  # 显示光标
+        self.out.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.render()
+
+    def render(self):
+        '''打印一行总体进度，覆盖上一次打印的'''
+        done, past = self.done.value, max(time.time() - self.start, 1e-6)
+        speed = done / past
+        line = '\r\33[?25l\33[K{}, '.format(self.name)  # 隐藏光标，清掉上一次的
+        if self.total:
+            done = min(done, self.total)
+            percent = done * 1000 // self.total
+            bar = '=' * (percent // 100) + ' ' * (10 - percent // 100)
+            remain = (self.total - done) / speed if speed else 0
+            line += '{:.1f}% [{}] {}/{} {:.1f} MB/s [{}<{}]'.format(
+                percent / 10, bar, humansize(done), humansize(self.total),
+                speed / (1 << 20), humantime(past), humantime(remain))
+        else:
+            line += '{} {:.1f} MB/s [{}]'.format(
+                humansize(done), speed / (1 << 20), humantime(past))
+        self.out.write(line)
+        self.out.flush()
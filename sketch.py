@@ -0,0 +1,80 @@
+#coding=utf-8
+from __future__ import print_function, division, unicode_literals
+import heapq
+from operator import itemgetter
+
+class SpaceSaving(object):
+    '''Space-Saving算法的可合并摘要，用于近似统计频数最高的键，内存大小固定。
+    最多保留capacity个键，每个键的计数是其真实频数的上界，减去误差error(key)
+    后是下界；没被保留的键的频数不超过floor，floor也是所有误差的上限
+    >>> s = SpaceSaving(2)
+    >>> s.update({'a': 5, 'b': 3, 'c': 1})
+    >>> s.most_common()
+    [('a', 5), ('b', 3)]
+    >>> s.update({'c': 4})
+    >>> s['c'], s.error('c'), s.floor, 'b' in s
+    (5, 1, 3, False)
+    '''
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0  # 没被保留的键可能有的最大频数
+        self.total = 0  # 所有键的频数之和
+
+    def update(self, other):
+        '''合并一个精确计数的Counter（或dict），或者另一个SpaceSaving摘要'''
+        if isinstance(other, SpaceSaving):
+            counts, errors, floor = other.counts, other.errors, other.floor
+            self.total += other.total
+        else:
+            counts, errors, floor = other, {}, 0
+            self.total += sum(other.values())
+        merged, errs = {}, {}
+        for k, n in counts.items():  # 一方没有的键，按其最大可能的频数floor计
+            merged[k] = self.counts.get(k, self.floor) + n
+            errs[k] = self.errors.get(k, self.floor) + errors.get(k, 0)
+        for k, n in self.counts.items():
+            if k not in merged:
+                merged[k] = n + floor
+                errs[k] = self.errors[k] + floor
+        self.floor += floor
+        if len(merged) > self.capacity:
+            top = heapq.nlargest(self.capacity + 1, merged.items(),
+                                 key=itemgetter(1))
+            self.floor = max(self.floor, top.pop()[1])
+            merged = dict(top)
+        self.counts = merged
+        self.errors = dict((k, errs[k]) for k in merged)
+
+    def error(self, key):
+        '''键key的计数最多比真实频数多出的数量'''
+        return self.errors.get(key, self.floor)
+
+    def most_common(self, n=None):
+        items = self.counts.items()
+        if n is None:
+            return sorted(items, key=itemgetter(1), reverse=True)
+        return heapq.nlargest(n, items, key=itemgetter(1))
+
+    def items(self):
+        return self.counts.items()
+
+    def values(self):
+        return self.counts.values()
+
+    def __getitem__(self, key):
+        return self.counts.get(key, 0)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def __len__(self):
+        return len(self.counts)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
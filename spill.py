@@ -0,0 +1,66 @@
+#coding=utf-8
+from __future__ import print_function, division, unicode_literals
+import os
+import heapq
+import tempfile
+import itertools
+from operator import itemgetter
+
+class Runs(list):
+    '''磁盘上按键排序的临时文件（run）的列表，统计结果超出内存上限时代替Counter'''
+
+def write_run(items, dirname):
+    '''把(键, 频数)按键排序后写成一个临时文件，每行"键\\t频数"，返回文件名；
+    items为Counter时写入其全部键'''
+    if hasattr(items, 'items'):
+        items = items.items()
+    fd, path = tempfile.mkstemp(suffix='.run', dir=dirname)
+    with os.fdopen(fd, 'wb') as f:
+        f.writelines('{}\t{}\n'.format(k, n).encode('utf-8')
+                     for k, n in sorted(items))
+    return path
+
+def read_run(path):
+    '''逐行读出临时文件中的(键, 频数)'''
+    with open(path, 'rb') as f:
+        for line in f:
+            k, n = line.decode('utf-8').rstrip('\n').rsplit('\t', 1)
+            yield k, int(n)
+
+def merge_sorted(streams):
+    '''k路归并多个按键排序的(键, 频数)序列，相同键的频数相加，仍按键的顺序生成'''
+    merged = heapq.merge(*streams)
+    for k, g in itertools.groupby(merged, key=itemgetter(0)):
+        yield k, sum(n for _, n in g)
+
+def merge_runs(paths, dirname):
+    '''k路归并多个按键排序的临时文件，相同键的频数相加，写成一个新的临时文件后
+    删除原来的文件，返回新文件名；同时打开的只有这些文件，内存占用与键的数量无关'''
+    merged = merge_sorted([read_run(p) for p in paths])
+    fd, path = tempfile.mkstemp(suffix='.run', dir=dirname)
+    with os.fdopen(fd, 'wb') as f:
+        f.writelines('{}\t{}\n'.format(k, n).encode('utf-8') for k, n in merged)
+    for p in paths:
+        os.remove(p)
+    return path
+
+def most_common_run(items, dirname, chunk):
+    '''外部排序：把(键, 频数)序列每chunk个排成一段按频数从高到低的临时文件，
+    再归并各段，按频数从高到低逐个生成(键, 频数)'''
+    items, runs = iter(items), []
+    while True:
+        part = sorted(itertools.islice(items, chunk), key=itemgetter(1),
+                      reverse=True)
+        if not part:
+            break
+        fd, p = tempfile.mkstemp(suffix='.sorted', dir=dirname)
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines('{}\t{}\n'.format(k, n).encode('utf-8') for k, n in part)
+        runs.append(p)
+    try:
+        for item in heapq.merge(*[read_run(p) for p in runs],
+                                key=itemgetter(1), reverse=True):
+            yield item
+    finally:
+        for p in runs:
+            os.remove(p)
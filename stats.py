@@ -0,0 +1,91 @@
+#coding=utf-8
+from __future__ import print_function, division, unicode_literals
+import os
+import json
+import time
+import threading
+from collections import Counter
+
+# 统计的各个阶段：读取、解码、切分计数（正则加生成一块的Counter）、并入本段的
+# Counter、子进程压缩结果、主进程解压并合并结果、写结果文件
+STAGES = ('read', 'decode', 'parse', 'update', 'pack', 'merge', 'write')
+COUNTS = ('bytes', 'lines')  # 每个任务处理的数据量
+
+class Probe(Counter):
+    '''一个任务（一段文件、一块文本或一组文件）各阶段的耗时（秒）和数据量，
+    用lap计时，只在块的粒度上调用，不在逐行的循环里调用
+    >>> p = Probe()
+    >>> p.lap('read') >= 0
+    True
+    >>> sorted(p)
+    ['read']
+    '''
+    def __init__(self, *args, **kwargs):
+        Counter.__init__(self, *args, **kwargs)
+        self.start = self.last = time.time()
+
+    def lap(self, stage=None):
+        '''把上次lap到现在的时间计入阶段stage，stage为None时只重新开始计时'''
+        now = time.time()
+        if stage is not None:
+            self[stage] += now - self.last
+        self.last = now
+        return now - self.start
+
+    def record(self, task, keys=None):
+        '''生成这个任务的记录：所在的进程（线程池中的任务还有线程名）、任务、
+        总耗时、键数及各阶段的耗时和数据量'''
+        worker, thread = str(os.getpid()), threading.current_thread()
+        if thread is not threading.main_thread():
+            worker += '/' + thread.name
+        return dict(self, worker=worker, task=task, keys=keys,
+                    seconds=time.time() - self.start)
+
+class Stats(object):
+    '''一次统计的分阶段耗时和数据量，由各个任务的记录汇总而来：
+    stages  各阶段的耗时之和（秒，多个进程的耗时相加，可能超过wall）
+    workers 每个进程（或线程）处理的任务数、数据量和各阶段耗时
+    tasks   每个任务一条记录，见Probe.record
+    '''
+    def __init__(self):
+        self.tasks = []
+        self.wall = 0.0  # 整个统计的实际耗时
+        self.keys = None  # 结果的键数，结果写到了磁盘上时为None
+
+    def add(self, record):
+        self.tasks.append(record)
+
+    @property
+    def stages(self):
+        return self.total(STAGES)
+
+    def total(self, names):
+        c = Counter()
+        for rec in self.tasks:
+            c.update(dict((k, rec[k]) for k in names if k in rec))
+        return c
+
+    @property
+    def workers(self):
+        res = {}
+        for rec in self.tasks:
+            c = res.setdefault(rec['worker'], Counter())
+            c.update(dict((k, rec[k]) for k in STAGES + COUNTS if k in rec))
+            c['tasks'] += 1
+            c['seconds'] += rec['seconds']
+        return res
+
+    def as_dict(self):
+        totals = self.total(COUNTS)
+        return {'wall': self.wall, 'keys': self.keys,
+                'bytes': totals['bytes'], 'lines': totals['lines'],
+                'stages': dict(self.stages),
+                'workers': dict((k, dict(v)) for k, v in self.workers.items()),
+                'tasks': self.tasks}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), ensure_ascii=False, sort_keys=True)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
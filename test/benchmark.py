@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''wordcounter的性能测试：生成指定大小、文字和行长的测试文件，对引擎、进程数和
+分段大小的各种组合分别统计，把速度（MB/s）和内存峰值写成json；指定--baseline
+时与之前保存的结果比较，速度下降超过阈值的组合视为性能退化
+
+How to use:
+python benchmark.py --size=64M --scripts=ascii,cjk --workers=0,1,4 --output=new.json
+python benchmark.py --backends=process,thread,serial --workers=4
+python benchmark.py --output=new.json --baseline=old.json --threshold=0.1
+'''
+from __future__ import print_function, division, unicode_literals
+import sys, os, time, json, random, platform, itertools, subprocess
+from datetime import datetime
+from multiprocessing import cpu_count
+try:
+    import resource
+except ImportError:  # Windows上没有resource模块，不统计内存峰值
+    resource = None
+
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,parentdir)
+from utils import humansize, parsesize
+
+SCRIPTS = ('ascii', 'cjk', 'mixed')  # 测试文件的文字：英文、中日韩汉字、两者混合
+ASCII = 'abcdefghijklmnopqrstuvwxyz'
+CJK = [chr(i) for i in range(0x4e00, 0x4e00 + 3000)]  # 常用汉字所在的码位
+SEED = 20170430  # 固定随机数种子，同样的参数总是生成同样的文件
+KEYS = ('script', 'size', 'line_length', 'engine', 'backend', 'workers',
+        'chunk_size')
+
+def words(rnd, script):
+    '''按Zipf分布生成无穷多个词，汉字每个词即一个字'''
+    if script == 'ascii':
+        vocab = [''.join(rnd.choice(ASCII) for _ in range(rnd.randint(1, 10)))
+                 for _ in range(5000)]
+    elif script == 'cjk':
+        vocab = CJK
+    else:  # 英文词和汉字交替
+        for w in itertools.chain.from_iterable(zip(words(rnd, 'ascii'),
+                                                   words(rnd, 'cjk'))):
+            yield w
+    weights = list(itertools.accumulate(1 / (i + 1) for i in range(len(vocab))))
+    while True:
+        for w in rnd.choices(vocab, cum_weights=weights, k=1000):
+            yield w
+
+def gen_corpus(path, size, script='cjk', line_length=80, seed=SEED):
+    '''生成约size字节的utf-8测试文件，每行约line_length个字符'''
+    if script not in SCRIPTS:
+        raise ValueError('Unknown script: {}'.format(script))
+    rnd, written = random.Random(seed), 0
+    sep = '' if script == 'cjk' else ' '
+    it = words(rnd, script)
+    with open(path, 'wb') as f:
+        while written < size:
+            line, n = [], 0
+            while n < line_length:
+                w = next(it)
+                line.append(w)
+                n += len(w) + len(sep)
+            data = (sep.join(line) + '\n').encode('utf-8')
+            f.write(data)
+            written += len(data)
+    return path
+
+def peak_rss(who):
+    '''进程（或其所有已结束子进程中）内存占用的峰值，单位为字节'''
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024  # Linux上单位为KB
+
+def run_one(config):
+    '''在本进程中统计一次，返回耗时和内存峰值；由bench在新的子进程中调用，
+    以免内存峰值受之前统计的影响'''
+    from wordcounter import WordCounter
+    w = WordCounter(config['path'], os.devnull, config['workers'], 'utf-8',
+                    engine=config['engine'], chunk_size=config['chunk_size'],
+                    backend=config['backend'], quiet=True)
+    start = time.time()
+    w.run()
+    seconds = time.time() - start
+    rss = [peak_rss(resource.RUSAGE_SELF), peak_rss(resource.RUSAGE_CHILDREN)
+           ] if resource is not None else [None, None]
+    return {'seconds': seconds, 'peak_rss': rss[0], 'peak_rss_workers': rss[1]}
+
+def bench(config, repeat=1):
+    '''在新的子进程中统计repeat次，取最快的一次'''
+    best = None
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                       'run', json.dumps(config)])
+        res = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+        if best is None or res['seconds'] < best['seconds']:
+            best = res
+    best['mbps'] = os.path.getsize(config['path']) / (1 << 20) / best['seconds']
+    return best
+
+def sweep(dirname, sizes, scripts, line_lengths, engines, workers, chunk_sizes,
+          repeat=1, backends=('process',)):
+    '''对各种参数的组合逐个统计，返回结果的列表'''
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    results = []
+    for size, script, line_length in itertools.product(sizes, scripts,
+                                                       line_lengths):
+        fn = '{}-{}-{}.txt'.format(script, size, line_length)
+        path = os.path.join(dirname, fn)
+        if not os.path.exists(path):
+            gen_corpus(path, size, script, line_length)
+        for engine, backend, n, chunk in itertools.product(
+                engines, backends, workers, chunk_sizes):
+            config = {'path': path, 'script': script, 'size': size,
+                      'line_length': line_length, 'engine': engine,
+                      'backend': backend, 'workers': n, 'chunk_size': chunk}
+            config.update(bench(config, repeat))
+            del config['path']
+            results.append(config)
+            print('{script:6} {0:>6} line {line_length:<4} {engine:6} {backend:7} '
+                  'workers {workers:<3} chunk {1:>6}: {mbps:8.2f} MB/s, '
+                  'peak rss {2}'.format(humansize(size),
+                                        humansize(chunk) if chunk else 'auto',
+                                        humansize(config['peak_rss'] or 0),
+                                        **config))
+    return results
+
+def compare(results, baseline, threshold=0.1):
+    '''与baseline中参数相同的结果比较，返回速度下降超过threshold的
+    [(参数, 原来的MB/s, 现在的MB/s), ...]'''
+    old = dict((tuple(r.get(k, 'process') for k in KEYS), r['mbps'])
+               for r in baseline['results'])  # 没有backend的旧结果都是进程池
+    regressions = []
+    for r in results:
+        key = tuple(r[k] for k in KEYS)
+        if key in old and r['mbps'] < old[key] * (1 - threshold):
+            regressions.append((dict(zip(KEYS, key)), old[key], r['mbps']))
+    return regressions
+
+def main():
+    if sys.argv[1:2] == ['run']:
+        print(json.dumps(run_one(json.loads(sys.argv[2]))))
+        return
+    opts = {'size': '16M', 'scripts': 'ascii,cjk,mixed', 'line_length': '80',
+            'engines': 'regex,vector', 'workers': '0,1,{}'.format(cpu_count()),
+            'chunk_sizes': 'auto', 'backends': 'process', 'repeat': '1', 
+            'dir': 'var',
+            'output': 'benchmark.json', 'baseline': None, 'threshold': '0.1'}
+    for i in sys.argv[1:]:
+        k, _, v = i.lstrip('-').partition('=')
+        if k not in opts:
+            raise ValueError('Unknown option: {}'.format(i))
+        opts[k] = v
+    split = lambda s: [i for i in s.split(',') if i]
+    # 测试文件生成在上一级目录的var文件夹中
+    dirname = os.path.join(parentdir, opts['dir'])
+    results = sweep(dirname, [parsesize(i) for i in split(opts['size'])],
+                    split(opts['scripts']),
+                    [int(i) for i in split(opts['line_length'])],
+                    split(opts['engines']),
+                    [int(i) for i in split(opts['workers'])],
+                    [None if i == 'auto' else parsesize(i)
+                     for i in split(opts['chunk_sizes'])],
+                    int(opts['repeat']), split(opts['backends']))
+    report = {'python': sys.version, 'platform': platform.platform(),
+              'cpu_count': cpu_count(), 'time': datetime.now().isoformat(),
+              'results': results}
+    with open(opts['output'], 'wb') as f:
+        f.write(json.dumps(report, indent=1, sort_keys=True).encode('utf-8'))
+    if opts['baseline']:
+        with open(opts['baseline'], 'rb') as f:
+            baseline = json.loads(f.read().decode('utf-8'))
+        regressions = compare(results, baseline, float(opts['threshold']))
+        for config, old, new in regressions:
+            print('Regression: {} {:.2f} MB/s -> {:.2f} MB/s'.format(
+                json.dumps(config, sort_keys=True), old, new))
+        if regressions:
+            exit(1)
+        print('No regression against {}'.format(opts['baseline']))
+
+if __name__ == '__main__':
+    main()
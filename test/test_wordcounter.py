@@ -1,13 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, unicode_literals
-import os, sys
+import os, sys, io, shutil, re
+import gzip, bz2, lzma, json
+import asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase, main
 from collections import Counter
 
 parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  
 sys.path.insert(0,parentdir) 
-from wordcounter import WordCounter
+os.environ['WORDCOUNTER_CODING_CACHE'] = ''  # 测试时不把判断出的编码存到磁盘上
+import charset, daemon
+from wordcounter import (WordCounter, pack_counter, unpack_counter, 
+                         merge_partials)
+from formats import read_bin, read_partial
 
 class WordCounterMultiprocessesTest(TestCase):
 
@@ -28,5 +35,495 @@ class WordCounterMultiprocessesTest(TestCase):
             self.assertEqual(c, w.counter)
             self.assertEqual(result, w.result)
 
+    def test_mmap(self):
+        f1 = 'tmp1.txt'
+        s = '一二三\n四五 六\n' * 1000 + '七八九'
+        with open(f1, 'wb') as f:
+            f.write(s.encode('utf-8'))
+        c = Counter(s.replace('\n', '').replace(' ', ''))
+        for workers in [0, 1, 3, 7]:
+            w = WordCounter(f1, None, workers, 'utf-8', 1, block_size=100,
+                            chunk_size=1000)
+            w.run()
+            self.assertEqual(c, w.counter)
+        w = WordCounter(f1, None, 3, 'utf-8', use_mmap=False, chunk_size=999)
+        w.run()
+        self.assertEqual(c, w.counter)
+
+    def test_vector_engine(self):
+        f1 = 'tmp1.txt'
+        s = 'ab c\t你好\u3000好\n😀x\n' * 500
+        with open(f1, 'wb') as f:
+            f.write(s.encode('utf-8'))
+        c = Counter(''.join(s.split()))
+        for workers in [0, 1, 3]:
+            w = WordCounter(f1, None, workers, 'utf-8', 1, engine='vector',
+                            chunk_size=1000)
+            w.run()
+            self.assertEqual(c, w.counter)
+
+    def test_shared_memory(self):
+        f1 = 'tmp1.txt'
+        s = '你好 世界\n😀ab\n' * 1000
+        with open(f1, 'wb') as f:
+            f.write(s.encode('utf-8'))
+        c = Counter(''.join(s.split()))
+        for engine in ['regex', 'vector']:
+            w = WordCounter(f1, None, 3, 'utf-8', engine=engine, 
+                            chunk_size=1000, aggregate='shm')
+            w.run()
+            self.assertEqual(c, w.counter)
+
+    def test_one_line_file(self):
+        f1 = 'tmp1.txt'
+        s = '中文没有换行😀，abc。' * 500
+        c = Counter(s)
+        for coding in ['utf-8', 'gb18030', 'utf-16-le', 'utf-32-be']:
+            with open(f1, 'wb') as f:
+                f.write(s.encode(coding))
+            w = WordCounter(f1, None, 3, coding, block_size=77, chunk_size=1001)
+            w.run()
+            self.assertEqual(c, w.counter)
+
+    def test_bom(self):
+        f1, f2 = 'tmp1.txt', 'tmp2.txt'
+        s = '带 BOM的文件\n😀abc\n' * 2000
+        chars, words = Counter(''.join(s.split())), Counter(re.findall(r'\w+', s))
+        for coding in ['utf-16', 'utf-32', 'utf-8-sig']:
+            data = s.encode(coding)
+            with open(f1, 'wb') as f:
+                f.write(data)
+            for given in [coding, None]:
+                for kw in [dict(), dict(use_mmap=False), dict(mode='word')]:
+                    w = WordCounter(f1, f2, 3, given, chunk_size=len(data)//7, 
+                                    quiet=True, **kw)
+                    w.run()
+                    self.assertEqual(words if kw.get('mode') else chars, 
+                                     w.counter)
+                    self.assertGreater(len(w.stats.tasks), 7)  # 真的分了段
+                with open(f2, 'rb') as f:
+                    self.assertEqual(w.result.encode(coding), f.read())
+            w = WordCounter.from_stream(io.BytesIO(data), workers=2, 
+                                        block_size=1001)
+            w.run()
+            self.assertEqual(chars, w.counter)
+            with open('tmp1.txt.gz', 'wb') as f:
+                f.write(b''.join(gzip.compress(data[i:i+5001]) 
+                                 for i in range(0, len(data), 5001)))
+            try:
+                for files in [['tmp1.txt.gz'], [f1, 'tmp1.txt.gz']]:
+                    w = WordCounter(files, None, 2, chunk_size=len(data)//3)
+                    w.run()
+                    self.assertEqual(sum([chars] * len(files), Counter()), 
+                                     w.counter)
+                w = WordCounter('tmp1.txt.gz', f2, 3, chunk_size=1)
+                w.run()
+                self.assertEqual(chars, w.counter)
+            finally:
+                os.remove('tmp1.txt.gz')
+
+    def test_stream(self):
+        s = '流式 统计\n😀abc\n' * 500
+        c = Counter(''.join(s.split()))
+        for workers in [0, 2]:
+            for coding in ['utf-8', 'gb18030']:
+                stream = io.BytesIO(s.encode(coding))
+                w = WordCounter.from_stream(stream, workers=workers, 
+                                            coding=coding, block_size=101)
+                w.run()
+                self.assertEqual(c, w.counter)
+                self.assertEqual(len(s.encode(coding)), w.filesize)
+
+    def test_compressed(self):
+        f1 = 'tmp1.txt'
+        s = '压缩 文件\n😀abc\n' * 500
+        c = Counter(''.join(s.split()))
+        data = s.encode('utf-8')
+        pieces = [data[i:i+1001] for i in range(0, len(data), 1001)]  #截断字
+        for compress in [gzip.compress, bz2.compress, lzma.compress]:
+            with open(f1, 'wb') as f:
+                f.write(b''.join(compress(i) for i in pieces))
+            for workers in [1, 3]:
+                w = WordCounter(f1, None, workers, chunk_size=1)
+                w.run()
+                self.assertEqual(c, w.counter)
+
+    def test_corpus(self):
+        d = 'tmpdir'
+        os.makedirs(os.path.join(d, 'sub'))
+        texts = {os.path.join(d, 'a.txt'): ('你好 世界\n' * 300, 'utf-8'),
+                 os.path.join(d, 'sub', 'b.log'): ('中文编码\n' * 200, 'gbk'),
+                 os.path.join(d, 'sub', 'c.txt.gz'): ('abc\n' * 100, 'utf-8')}
+        for fn, (text, coding) in texts.items():
+            data = text.encode(coding)
+            with open(fn, 'wb') as f:
+                f.write(gzip.compress(data) if fn.endswith('.gz') else data)
+        c = Counter(''.join(''.join(i for i, _ in texts.values()).split()))
+        try:
+            for workers in [0, 2]:
+                w = WordCounter([d], None, workers, chunk_size=1000, per_file=True)
+                w.run()
+                self.assertEqual(c, w.counter)
+                self.assertEqual(sorted(texts), sorted(w.file_counters))
+                for fn, (text, _) in texts.items():
+                    self.assertEqual(Counter(''.join(text.split())), 
+                                     w.file_counters[fn])
+            w = WordCounter([os.path.join(d, '**', '*.txt')], None, 2)
+            w.run()
+            text = texts[os.path.join(d, 'a.txt')][0]
+            self.assertEqual(Counter(''.join(text.split())), w.counter)
+        finally:
+            shutil.rmtree(d)
+
+    def test_incremental(self):
+        f1, f2 = 'tmp1.txt', 'tmp2.txt'
+        ckpt = f2 + '.checkpoint'
+        if os.path.exists(ckpt):
+            os.remove(ckpt)
+        s1, s2 = '第一次\n一半', '统计\n追加 内容\n'
+        for workers in [0, 1, 3]:
+            with open(f1, 'wb') as f:
+                f.write(s1.encode('utf-8'))
+            w = WordCounter(f1, f2, workers, 'utf-8', chunk_size=5, 
+                            incremental=True)
+            w.run()
+            self.assertEqual(Counter('第一次'), w.counter)  #没写完的行不统计
+            with open(f1, 'ab') as f:
+                f.write(s2.encode('utf-8'))
+            w = WordCounter(f1, f2, workers, 'utf-8', chunk_size=5, 
+                            incremental=True)
+            w.run()
+            self.assertEqual(len('第一次\n'.encode('utf-8')), w.offset)
+            self.assertEqual(Counter(''.join((s1 + s2).split())), w.counter)
+            with open(f1, 'wb') as f:  # 文件被轮换
+                f.write('新文件\n'.encode('utf-8'))
+            w = WordCounter(f1, f2, workers, 'utf-8', incremental=True)
+            w.run()
+            self.assertEqual(0, w.offset)
+            self.assertEqual(Counter('新文件'), w.counter)
+            os.remove(ckpt)
+
+    def test_modes(self):
+        f1 = 'tmp1.txt'
+        lines = ['hello, world 你好世界', 'the quick fox; the lazy dog', 
+                 '中文 二元组 hello world'] * 50
+        s = '\n'.join(lines) + '\n'
+        words = [re.findall(r'\w+', i) for i in lines]
+        expected = {
+            'word': Counter(w for ws in words for w in ws),
+            'ngram': Counter(t[i:i+2] for l in lines for t in l.split() 
+                             for i in range(len(t) - 1)),
+            'word_ngram': Counter(' '.join(ws[i:i+2]) for ws in words 
+                                  for i in range(len(ws) - 1)),
+        }
+        with open(f1, 'wb') as f:
+            f.write(s.encode('utf-8'))
+        for mode, c in expected.items():
+            for workers in [0, 1, 3]:
+                w = WordCounter(f1, None, workers, 'utf-8', block_size=37, 
+                                chunk_size=101, mode=mode)
+                w.run()
+                self.assertEqual(c, w.counter)
+            w = WordCounter.from_stream(io.BytesIO(s.encode('utf-8')), 
+                    workers=2, coding='utf-8', block_size=37, mode=mode)
+            w.run()
+            self.assertEqual(c, w.counter)
+
+    def test_approx(self):
+        f1 = 'tmp1.txt'
+        words = ['w{}'.format(i) for i in range(300)]
+        lines = [' '.join(words[:i % 300 + 1][::-1][:3 + i % 7]) 
+                 for i in range(3000)] + [' '.join(words[:5] * 300)] * 20
+        s = '\n'.join(lines)
+        with open(f1, 'wb') as f:
+            f.write(s.encode('utf-8'))
+        exact = Counter(s.split())
+        for workers, kw in [(0, {}), (1, {}), (3, {}), (3, dict(use_mmap=False))]:
+            w = WordCounter(f1, None, workers, 'utf-8', chunk_size=3000, 
+                            block_size=500, mode='word', top=5, approx=True, **kw)
+            w.run()
+            c = w.counter
+            self.assertEqual(set(i for i, _ in exact.most_common(5)), 
+                             set(i for i, _ in c.most_common(5)))
+            for k, n in c.items():
+                self.assertTrue(n - c.error(k) <= exact[k] <= n)
+                self.assertTrue(c.error(k) <= c.floor)
+            self.assertEqual(sum(exact.values()), c.total)
+            self.assertTrue(len(c) <= 50)
+
+    def test_spill(self):
+        f1 = 'tmp1.txt'
+        s = '\n'.join(' '.join('w{}'.format(i * j % 97) for j in range(20)) 
+                      for i in range(300))
+        with open(f1, 'wb') as f:
+            f.write(s.encode('utf-8'))
+        exact = Counter(s.split())
+        for workers in [0, 1, 3]:
+            w = WordCounter(f1, None, workers, 'utf-8', 1, block_size=200,
+                            chunk_size=1000, mode='word', max_memory=128*10)
+            w.run()
+            self.assertFalse(w._c)  # 结果在磁盘上
+            items = list(w.most_common())
+            self.assertEqual(sorted(exact.items()), sorted(items))
+            self.assertEqual(sorted(items, key=lambda x: -x[1]), items)
+            self.assertEqual(exact.most_common(1)[0][1], 
+                             list(w.most_common(3))[0][1])
+            self.assertEqual(exact, w.counter)
+            spill_dir = w.spill_dir
+            del w
+            self.assertFalse(os.path.exists(spill_dir))
+
+    def test_formats(self):
+        f1, f2 = 'tmp1.txt', 'tmp2.txt'
+        s = '格式 格式 tsv json\n二进制 tsv\n' * 30
+        with open(f1, 'wb') as f:
+            f.write(s.encode('utf-8'))
+        c = Counter(s.split())
+        readers = {
+            'text': lambda f: [l.decode('utf-8').rsplit(': ', 1) 
+                               for l in f.read().split(b'\n')],
+            'tsv': lambda f: [l.decode('utf-8').rstrip('\n').split('\t') 
+                              for l in f],
+            'jsonl': lambda f: [(d['key'], d['count']) 
+                                for d in map(json.loads, f)],
+            'bin': read_bin,
+        }
+        for fmt, reader in readers.items():
+            for top in [None, 2]:
+                w = WordCounter(f1, f2, 0, 'utf-8', mode='word', top=top,
+                                out_format=fmt)
+                w.run()
+                with open(f2, 'rb') as f:
+                    items = [(k, int(n)) for k, n in reader(f)]
+                self.assertEqual(c.most_common(top), items)
+                if fmt == 'text':
+                    with open(f2, 'rb') as f:
+                        self.assertEqual(w.result, f.read().decode('utf-8'))
+
+    def test_partial(self):
+        texts = ['分布 统计 map\nreduce 统计\n' * 20, 'map map 合并\n' * 30,
+                 '统计 合并 分布\n' * 10]
+        parts = []
+        for i, t in enumerate(texts):
+            fn, part = 'tmp1.txt', 'tmp_part{}.cnt'.format(i)
+            with open(fn, 'wb') as f:
+                f.write(t.encode('utf-8'))
+            WordCounter(fn, part, 0, 'utf-8', mode='word', 
+                        emit_partial=True).run()
+            parts.append(part)
+        c = Counter(''.join(texts).split())
+        try:
+            self.assertEqual(sorted(Counter(texts[1].split()).items()), 
+                             list(read_partial(parts[1])))
+            for workers in [1, 2]:
+                merge_partials(parts, 'tmp2.txt', workers, 'tsv')
+                with open('tmp2.txt', 'rb') as f:
+                    items = [l.decode('utf-8').rstrip('\n').split('\t') 
+                             for l in f]
+                self.assertEqual(c, Counter(dict((k, int(n)) 
+                                                 for k, n in items)))
+                self.assertEqual(sorted(c.values(), reverse=True), 
+                                 [int(n) for _, n in items])
+                merge_partials(parts, 'tmp2.txt', workers, emit_partial=True)
+                self.assertEqual(sorted(c.items()), list(read_partial('tmp2.txt')))
+            WordCounter('tmp1.txt', parts[0], 0, 'utf-8', emit_partial=True).run()
+            self.assertRaises(ValueError, merge_partials, parts, 'tmp2.txt', 1)
+        finally:
+            for p in parts:
+                os.remove(p)
+
+    def test_progress(self):
+        f1, f2 = 'tmp1.txt', 'tmp2.txt'
+        with open(f1, 'wb') as f:
+            f.write(('进度 progress 汇总\n' * 20000).encode('utf-8'))
+        size = os.path.getsize(f1)
+        for kw in [dict(workers=0), dict(workers=1), 
+                   dict(workers=2, chunk_size=size//5),
+                   dict(workers=2, chunk_size=size//5, use_mmap=False)]:
+            w = WordCounter(f1, f2, coding='utf-8', **kw)
+            w.run()
+            self.assertEqual(size, w.progress.done.value)
+        with gzip.open('tmp1.txt.gz', 'wb') as f:
+            f.write(b'gzip progress\n' * 1000)
+        try:
+            w = WordCounter('tmp1.txt.gz', f2, 2, 'utf-8')
+            w.run()
+            self.assertEqual(os.path.getsize('tmp1.txt.gz'), w.progress.done.value)
+        finally:
+            os.remove('tmp1.txt.gz')
+        w = WordCounter(f1, f2, 2, 'utf-8', chunk_size=size//5, quiet=True)
+        w.run()
+        self.assertIsNone(w.progress)
+
+    def test_stats(self):
+        f1, f2 = 'tmp1.txt', 'tmp2.txt'
+        with open(f1, 'wb') as f:
+            f.write(('阶段 stage 耗时\n' * 20000).encode('utf-8'))
+        size = os.path.getsize(f1)
+        for kw in [dict(workers=0), dict(workers=1), 
+                   dict(workers=2, chunk_size=size//5)]:
+            w = WordCounter(f1, f2, coding='utf-8', quiet=True, **kw)
+            w.run()
+            d = json.loads(w.stats.to_json())
+            self.assertEqual(size, d['bytes'])
+            self.assertEqual(20000, d['lines'])
+            self.assertEqual(len(w.counter), d['keys'])
+            self.assertIn('parse', d['stages'])
+            self.assertIn('write', d['stages'])
+        self.assertEqual(6, len(w.stats.tasks))
+        prof = 'tmp_profile'
+        try:
+            w = WordCounter(f1, f2, 2, 'utf-8', chunk_size=size//5, quiet=True,
+                            profile=prof)
+            w.run()
+            names = os.listdir(prof)
+            self.assertIn('parent.prof', names)
+            self.assertTrue(any(i.startswith('worker-') for i in names))
+        finally:
+            shutil.rmtree(prof, True)
+
+    def test_benchmark(self):
+        from benchmark import gen_corpus, bench, compare
+        f1, f2 = 'tmp1.txt', 'tmp2.txt'
+        for script in ['ascii', 'cjk', 'mixed']:
+            gen_corpus(f1, 20000, script, 40)
+            gen_corpus(f2, 20000, script, 40)
+            with open(f1, 'rb') as a, open(f2, 'rb') as b:
+                self.assertEqual(a.read(), b.read())
+        self.assertGreaterEqual(os.path.getsize(f1), 20000)
+        config = {'path': f1, 'engine': 'regex', 'workers': 2, 'chunk_size': None,
+                  'backend': 'thread'}
+        res = bench(config)
+        self.assertGreater(res['mbps'], 0)
+        result = dict(script='cjk', size=1, line_length=1, engine='regex',
+                      backend='process', workers=0, chunk_size=None, mbps=10.0)
+        baseline = {'results': [dict(result, mbps=12.0)]}
+        self.assertEqual([], compare([result], baseline, 0.2))
+        self.assertEqual(1, len(compare([result], baseline, 0.1)))
+
+    def test_backends(self):
+        f1, f2 = 'tmp1.txt', 'tmp2.txt'
+        s = '执行 器 backend\n线程 进程\n😀 serial\n' * 3000
+        data = s.encode('utf-8')
+        with open(f1, 'wb') as f:
+            f.write(data)
+        chars, words = Counter(''.join(s.split())), Counter(re.findall(r'\w+', s))
+        size = len(data)
+        for backend in ['process', 'thread', 'serial']:
+            for kw in [dict(), dict(use_mmap=False), dict(mode='word')]:
+                w = WordCounter(f1, f2, 3, 'utf-8', chunk_size=size//7, 
+                                backend=backend, quiet=True, **kw)
+                w.run()
+                self.assertEqual(words if kw.get('mode') else chars, w.counter)
+            w = WordCounter.from_stream(io.BytesIO(data), f2, workers=2, 
+                                        block_size=1000, backend=backend)
+            w.run()
+            self.assertEqual(chars, w.counter)
+            with open('tmp1.txt.gz', 'wb') as f:
+                f.write(b''.join(gzip.compress(data[i:i+5001]) 
+                                 for i in range(0, size, 5001)))
+            try:
+                w = WordCounter('tmp1.txt.gz', f2, 3, 'utf-8', chunk_size=1,
+                                backend=backend)
+                w.run()
+                self.assertEqual(chars, w.counter)
+            finally:
+                os.remove('tmp1.txt.gz')
+        w = WordCounter(f1, f2, 3, 'utf-8', chunk_size=size//7, backend='thread')
+        w.run()
+        self.assertTrue(any('/' in i for i in w.stats.workers))
+        self.assertRaises(ValueError, WordCounter, f1, f2, backend='fiber')
+
+    def test_coding(self):
+        f1 = 'tmp1.txt'
+        head = b'ascii only header\n' * 20000
+        self.assertEqual('utf-8', charset.detect_coding(head + '中文'.encode('utf-8')))
+        for coding in ['utf-16', 'utf-32', 'utf-8-sig']:
+            data = '带BOM'.encode(coding)
+            explicit = charset.detect_coding(data)
+            self.assertIn(explicit, ('utf-16-le', 'utf-32-le', 'utf-8'))
+            self.assertEqual((explicit, data[:len(data) - len(
+                '带BOM'.encode(explicit))]), charset.split_bom(data, coding))
+        gbk = head + '中文编码的测试\n'.encode('gbk') * 5000
+        self.assertEqual('中文编码的测试', 
+                         gbk.decode(charset.detect_coding(gbk))[-8:-1])
+        chardet = sys.modules.get('chardet')
+        sys.modules['chardet'] = None  # 没装chardet时
+        try:
+            self.assertEqual('gb18030', charset.detect_coding(gbk[-5000:]))
+        finally:
+            if chardet is None:
+                del sys.modules['chardet']
+            else:
+                sys.modules['chardet'] = chardet
+        with open(f1, 'wb') as f:
+            f.write(gbk)
+        cache, detect = charset.CACHE, charset.detect_samples
+        charset.CACHE, charset._cache = 'tmp_codings.json', None
+        try:
+            coding = charset.detect_file(f1)
+            charset.save_cache()
+            charset._cache = None
+            charset.detect_samples = None  # 缓存命中时不再判断
+            self.assertEqual(coding, charset.detect_file(f1))
+            charset.detect_samples = detect
+            with open(f1, 'ab') as f:
+                f.write(b'changed\n')
+            self.assertEqual(coding, charset.detect_file(f1))
+            self.assertEqual(2, len(charset.load_cache()[os.path.abspath(f1)][:2]))
+        finally:
+            charset.CACHE, charset.detect_samples = cache, detect
+            charset._cache = None
+            if os.path.exists('tmp_codings.json'):
+                os.remove('tmp_codings.json')
+
+    def test_daemon(self):
+        f1, f2 = 'tmp1.txt', 'tmp2.txt'
+        s = '常驻 服务\n进程池 daemon\n' * 5000
+        with open(f1, 'wb') as f:
+            f.write(s.encode('utf-8'))
+        c = Counter(''.join(s.split()))
+        path = os.path.abspath('tmp_wordcounter.sock')
+        server = daemon.Server(path, workers=2, max_jobs=2)
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+            argv = [f1, f2, '--workers=2', '--chunk_size=20000', '--stats=json']
+            res = daemon.forward(argv, path=path)
+            self.assertIn('Workers: 2', res['output'])
+            self.assertTrue(res['stats']['tasks'])
+            w = WordCounter(f1, f2, 2, 'utf-8', chunk_size=20000, quiet=True)
+            w.run()
+            with open(f2, 'rb') as f:
+                self.assertEqual(w.result, f.read().decode('utf-8'))
+            # 多个统计同时用同一个进程池，结果互不影响
+            pool = ThreadPoolExecutor(4)
+            argvs = [[f1, '--workers=2', '--chunk_size=7000', '--mode=' + m]
+                     for m in ['char', 'word'] * 2]
+            words = Counter(re.findall(r'\w+', s))
+            for res, m in zip(pool.map(lambda a: daemon.forward(a, path=path), 
+                                       argvs), ['char', 'word'] * 2):
+                lines = res['output'].split('\n\n')[0].splitlines()
+                self.assertEqual(words if m == 'word' else c, Counter(
+                    dict((k, int(n)) for k, n in (l.split(': ') for l in lines))))
+            pool.shutdown()
+            self.assertIn('error', daemon.forward(['nothing.txt'], path=path))
+            server.jobs = server.max_jobs + server.max_queue  # 模拟排满了
+            self.assertEqual({'error': 'busy'}, daemon.forward([f1], path=path))
+            server.jobs = 0
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            server.close()
+            loop.close()
+        self.assertIsNone(daemon.forward([f1], path=path))
+
+    def test_pack_counter(self):
+        c = Counter('你好你好世界ab')
+        self.assertEqual(c, unpack_counter(pack_counter(c)))
+        self.assertEqual(Counter(), unpack_counter(pack_counter(Counter())))
+
 if __name__ == '__main__':
     main()
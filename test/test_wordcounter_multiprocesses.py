@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, unicode_literals
+import os, sys
 from unittest import TestCase, main
 from collections import Counter
 
-from wordcounter_multiprocesses import WordCounter
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  
+sys.path.insert(0,parentdir) 
+from wordcounter import WordCounter
 
 class WordCounterMultiprocessesTest(TestCase):
 
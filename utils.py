@@ -21,6 +21,21 @@ def humansize(size):
         size = size // 1024
     return '{} {}'.format(size, unit)
 
+def parsesize(size):
+    """将带单位的大小转成字节数，humansize的逆操作
+    >>> parsesize('512M') == 512*1024*1024
+    True
+    >>> parsesize('2 G') == 1024*1024*1024*2
+    True
+    >>> parsesize('1000') == 1000
+    True
+    """
+    units = ['B', 'K', 'M', 'G', 'T']
+    size = str(size).strip().upper().rstrip('B') or '0'
+    if size[-1] in units:
+        return int(float(size[:-1]) * 1024 ** units.index(size[-1]))
+    return int(size)
+
 def humantime(seconds):
     """将秒数转成00:00:00的形式
     >>> humantime(3600) == '01:00:00'
@@ -2,146 +2,1455 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, unicode_literals
 import sys, re, time, os
-import operator
-from collections import Counter
-from functools import reduce
-from multiprocessing import Pool, cpu_count
+import glob
+import itertools
+import heapq
+import json, hashlib
+import shutil, tempfile, weakref
+import mmap
+import codecs
+import cProfile
+import zlib, gzip, bz2
+from array import array
+from collections import Counter, deque
+import threading
+from multiprocessing import Value, cpu_count
+from concurrent.futures import (Executor, Future, ProcessPoolExecutor, 
+                                ThreadPoolExecutor, wait, FIRST_COMPLETED)
 from datetime import datetime
-from utils import humansize, humantime, processbar
+from utils import humansize, parsesize
+from progress import Progress, report, STEP
+from stats import Stats, Probe
+from charset import detect_coding, detect_file, save_cache, split_bom
+from sketch import SpaceSaving
+from spill import (Runs, write_run, read_run, merge_runs, merge_sorted,
+                   most_common_run)
+from formats import (FORMATS, write_counts, write_partial, read_partial,
+                     read_partial_meta)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import lzma
+except ImportError:
+    lzma = None
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python3.8以前没有共享内存模块
+    shared_memory = None
 
-def wrap(wcounter,  fn, p1, p2, f_size):
-    return wcounter.count_multi(fn, p1, p2, f_size)
+BLOCK_SIZE = 1 << 24  # mmap模式下每次解码统计的块大小（16M）
+MIN_CHUNK_SIZE = 1 << 22  # 自动选择的分段大小下限（4M）
+MAX_CHUNK_SIZE = 1 << 26  # 自动选择的分段大小上限（64M）
+APPROX_FACTOR = 10  # 近似统计时SpaceSaving摘要保留的键数为top的倍数
+SORT_KEYS = 1 << 20  # 合并部分统计文件时，外部排序每段的键数
+KEY_BYTES = 128  # 估算内存占用时Counter中每个键平均所占的字节数
+BMP_SIZE = 0x10000  # 共享内存中每个进程的计数槽按BMP码位直接下标
+PIECE_SIZE = 1 << 20  # 解压时每次读取的压缩数据大小（1M）
+MODES = ('char', 'word', 'ngram', 'word_ngram')  # 统计单位：字、词、字n元组、词n元组
+WORD = re.compile(r'\w+')  # 按空白和标点分词
+WORD_OR_NEWLINE = re.compile(r'\w+|\n')
+SPACE = re.compile(r'\s')
+SPACE_BYTE = re.compile(b'\\s')
+SPACE_CHARS = ' \t\n\r\x0b\x0c'  # 与SPACE_BYTE对应的空白字符
+
+# 压缩格式：(文件头的魔数, 成员开头的特征, 新建解压器的函数, 打开文件的函数)
+# 成员开头的特征用于在多成员的gzip和多stream的bz2文件中找出可以并行解压的位置
+COMPRESSIONS = {
+    'gz': (b'\x1f\x8b', re.compile(b'\x1f\x8b\x08[\x00-\x1f]'),
+           lambda: zlib.decompressobj(31), gzip.open),
+    'bz2': (b'BZh', re.compile(b'BZh[1-9]1AY&SY'), bz2.BZ2Decompressor, bz2.open),
+}
+if lzma is not None:  # xz文件只有一个stream，只能边解压边统计
+    COMPRESSIONS['xz'] = (b'\xfd7zXZ\x00', None, 
+                          lambda: lzma.LZMADecompressor(lzma.FORMAT_XZ), lzma.open)
+
+BACKENDS = ('process', 'thread', 'serial')  # 执行分段任务的方式：进程池、线程池、依次执行
+# 各引擎的统计核心是否在大部分时间里释放GIL，释放时默认用线程池；vector引擎只有
+# bincount不占GIL，解码和转成码位数组都要占，所以仍是False
+RELEASES_GIL = {'regex': False, 'vector': False}
+
+# 每个工作进程（或线程）自己的状态：wcounter是只含设置、不含统计结果的WordCounter，
+# slot是aggregate='shm'时的(共享内存, 计数槽)，profiler是使用profile时的cProfile
+_worker = threading.local()
+_jobs = itertools.count()  # 交给常驻进程池的各次统计的编号，见JobExecutor
+
+def gil_disabled():
+    '''是否运行在关闭了GIL的自由线程（free-threaded）CPython上'''
+    return getattr(sys, '_is_gil_enabled', lambda: True)() is False
+
+def default_backend(engine):
+    '''自由线程的CPython上或统计核心释放GIL时用线程，省去启动进程和pickle的开销'''
+    if gil_disabled() or RELEASES_GIL.get(engine):
+        return 'thread'
+    return 'process'
+
+class SerialExecutor(Executor):
+    '''在调用者的线程里依次执行任务的执行器，backend='serial'时代替进程池和线程池，
+    与它们共用分段和合并的代码'''
+    def __init__(self, max_workers=None, initializer=None, initargs=()):
+        if initializer is not None:
+            initializer(*initargs)
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+class JobExecutor(Executor):
+    '''把一次统计的任务交给常驻的进程池executor：设置随每个任务一起传过去，进程
+    发现任务属于新的一次统计时才重新初始化（见run_job）；shutdown只取消这次统计
+    还没开始的任务，不关闭常驻的进程池'''
+    def __init__(self, executor, options):
+        self.executor, self.options = executor, options
+        self.job = '{}-{}'.format(os.getpid(), next(_jobs))
+        self.pending = set()
+
+    def submit(self, fn, *args):
+        future = self.executor.submit(run_job, self.job, self.options, fn, *args)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        if cancel_futures:
+            for future in list(self.pending):
+                future.cancel()
+
+def run_job(job, options, fn, *args):
+    '''在常驻的进程中执行一次统计job的任务，换了一次统计才调用init_worker'''
+    if getattr(_worker, 'job', None) != job:
+        init_worker(options)
+        _worker.job = job
+    return fn(*args)
+
+def imap_unordered(executor, fn, tasks, ahead):
+    '''像Pool.imap_unordered一样，哪个任务先做完就先返回哪个的结果；最多只提交
+    ahead个还没取走结果的任务，做完的结果不会在内存中堆积'''
+    pending = set()
+    for task in tasks:
+        if len(pending) >= ahead:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(executor.submit(fn, task))
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+def init_worker(options, shm_name=None, slots=None):
+    '''进程池（或线程池）的initializer：编码、引擎等设置只在每个进程启动时传一次；
+    使用共享内存汇总时，每个进程在这里领取属于自己的计数槽'''
+    wcounter = _worker.wcounter = WordCounter.__new__(WordCounter)
+    wcounter.__dict__.update(options)
+    wcounter.flush()
+    _worker.slot = _worker.profiler = None
+    if wcounter.profile:
+        _worker.profiler = cProfile.Profile()
+        _worker.profiler.enable()
+    if shm_name is not None:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        with slots.get_lock():
+            i = slots.value
+            slots.value += 1
+        _worker.slot = (shm, shm.buf.cast('q')[i*BMP_SIZE:(i+1)*BMP_SIZE])
+
+def pack(c):
+    '''在子进程中压缩统计结果，耗时计入pack阶段；线程和依次执行时结果不用pickle，
+    直接传回'''
+    if _worker.wcounter.backend != 'process':
+        return c
+    probe = _worker.wcounter._probe
+    probe.lap()
+    packed = pack_counter(c)
+    probe.lap('pack')
+    return packed
+
+def finish_task(task, result, keys=None):
+    '''子进程的任务做完后，把结果连同这个任务的记录（见stats.Probe.record）一起
+    传回主进程；使用profile时把本进程到目前为止的profile数据写入文件'''
+    wcounter, profiler = _worker.wcounter, _worker.profiler
+    record = wcounter._probe.record(task, keys)
+    if profiler is not None:
+        path = 'worker-{}.prof'.format(os.getpid())
+        if wcounter.backend != 'process':  # 线程各自写一个文件
+            path = 'worker-{}-{}.prof'.format(os.getpid(), threading.get_ident())
+        profiler.dump_stats(os.path.join(wcounter.profile, path))
+        profiler.enable()  # dump_stats会停止profile
+    return result, record
+
+def keys_of(c):  #统计结果的键数，结果写到了磁盘上时为None
+    return None if isinstance(c, Runs) else len(c)
+
+def wrap(args):
+    fn, p1, p2 = args
+    _worker.wcounter._probe = Probe()
+    c = _worker.wcounter.count_multi(fn, p1, p2, os.path.getsize(fn))
+    if _worker.slot is not None and isinstance(c, Counter):
+        c = add_to_slot(_worker.slot[1], c)
+    return finish_task('{}:{}-{}'.format(fn, p1, p2), pack(c), keys_of(c))
+
+def wrap_text(text):
+    probe = _worker.wcounter._probe = Probe()
+    c = _worker.wcounter.parse_text(text)
+    probe.lap('parse')
+    probe['lines'] += text.count('\n')
+    return finish_task('<text>', pack(c), len(c))
+
+def wrap_files(segments):
+    _worker.wcounter._probe = Probe()
+    res = [(fn, pack(c)) for fn, c in _worker.wcounter.count_files(segments)]
+    save_cache()  # 这一批文件判断出的编码
+    return finish_task(','.join(fn for fn, _ in res), res)
+
+def wrap_merge(args):
+    paths, dirname, meta = args
+    fd, path = tempfile.mkstemp(suffix='.cnt', dir=dirname)
+    with os.fdopen(fd, 'wb') as f:
+        write_partial(f, merge_sorted([read_partial(p) for p in paths]), meta)
+    return path
+
+def wrap_compressed(args):
+    fn, fmt, p1, p2 = args
+    _worker.wcounter._probe = Probe()
+    task = '{}:{}-{}'.format(fn, p1, p2)
+    try:
+        c, head, tail = _worker.wcounter.count_compressed(fn, fmt, p1, p2)
+    except (ValueError, EOFError, IOError, OSError, zlib.error):
+        return finish_task(task, (p1, None))  # 分段处其实不是成员的开头，由主进程改为串行解压
+    return finish_task(task, (p1, (pack(c), head, tail)), len(c))
+
+def add_to_slot(slot, c):
+    '''把BMP内的字的计数直接加到共享内存的计数槽里，返回剩下的（BMP以外的）计数'''
+    rest = Counter()
+    for k, n in c.items():
+        i = ord(k)
+        if i < BMP_SIZE:
+            slot[i] += n
+        else:
+            rest[k] = n
+    return rest
+
+def sum_slots(shm, n):
+    '''把共享内存里n个计数槽按码位相加，得到一个BMP码位直方图'''
+    if np is not None:
+        slots = np.ndarray((n, BMP_SIZE), dtype=np.int64, buffer=shm.buf)
+        hist = slots.sum(axis=0)
+        del slots  # 释放对共享内存的引用，否则无法close
+        return hist
+    buf = shm.buf.cast('q')
+    hist = array('q', buf[:BMP_SIZE])
+    for i in range(1, n):
+        slot = buf[i*BMP_SIZE:(i+1)*BMP_SIZE]
+        for j in range(BMP_SIZE):
+            hist[j] += slot[j]
+    buf.release()
+    return hist
+
+def pack_counter(c):
+    '''把Counter压缩成(用换行符连接的键, 计数数组)，传回主进程时只需pickle一个字符串
+    和一段字节，统计的键不含换行符，所以可以用换行符分隔；SpaceSaving摘要本身
+    大小固定，Runs只是文件名的列表，都直接传回'''
+    if not isinstance(c, Counter):
+        return c
+    return '\n'.join(c), array('q', c.values())
+
+def unpack_counter(packed):
+    '''pack_counter的逆操作'''
+    if not isinstance(packed, tuple):
+        return packed
+    keys, counts = packed
+    return Counter(dict(zip(keys.split('\n'), counts)))
+
+def auto_chunk_size(filesize, workers):
+    '''根据文件大小和进程数选择分段大小，使每个进程平均能分到约4个分段，
+    以便先做完的进程去领取下一段，分段大小限制在4M~64M之间'''
+    size = filesize // (workers * 4) + 1
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, size))
+
+def codepoint_hist(text):
+    '''vector引擎的统计核心：把文本转成UTF-32码位数组后用bincount统计直方图，
+    空白字符按下标直接清零，不再用正则替换'''
+    a = np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+    hist = np.bincount(a)
+    hist[SPACES[SPACES < len(hist)]] = 0
+    return hist
+
+def add_hist(h1, h2):
+    '''合并两个长度可能不同的码位直方图'''
+    if h1 is None:
+        return h2
+    if len(h1) < len(h2):
+        h1, h2 = h2, h1
+    if np is None:
+        for i, n in enumerate(h2):
+            h1[i] += n
+    else:
+        h1[:len(h2)] += h2
+    return h1
+
+def hist_to_counter(hist):
+    '''把码位直方图转成Counter，只在最后调用一次'''
+    if hist is None:
+        return Counter()
+    if np is None:
+        return Counter(dict((chr(i), n) for i, n in enumerate(hist) if n))
+    idx = np.flatnonzero(hist)
+    return Counter(dict(zip(map(chr, idx.tolist()), hist[idx].tolist())))
+
+if np is not None:  # 与正则\s等价的空白字符码位
+    SPACES = np.array([i for i in range(0x3001) if re.match(r'\s', chr(i))])
+
+def align_newline(mm, pos):
+    '''返回pos-1处及其后第一个换行符的下一个位置，即从pos开始的第一个完整行的行首，
+    与按行读取时分段处所在行不处理的规则一致'''
+    if pos <= 0:
+        return 0
+    i = mm.find(b'\n', pos - 1)
+    return len(mm) if i == -1 else i + 1
+
+_rules = {}  # 各编码对应的字符边界规则的缓存
+LOW_BYTE = re.compile(b'[\x00-\x2f]')
+
+def iter_texts(blocks, coding):
+    '''把按固定大小读取的字节块逐个解码成字符串，被块边界截断的字由增量解码器
+    留到下一块再解码'''
+    decoder = codecs.getincrementaldecoder(coding)()
+    for block in blocks:
+        text = decoder.decode(block)
+        if text:
+            yield text
+    text = decoder.decode(b'', True)
+    if text:
+        yield text
+
+def file_coding(fn, coding=None):
+    '''文件fn的编码：未指定时自动判断（见charset.detect_file），判断不出时用utf-8；
+    再按开头的BOM明确字节序（见charset.split_bom），返回(编码, BOM)。压缩文件
+    都看解压后的内容'''
+    fmt = detect_compression(fn)
+    opener = COMPRESSIONS[fmt][3] if fmt else open
+    if coding is None:
+        coding = detect_file(fn, opener if fmt else None) or 'utf-8'
+    with opener(fn, 'rb') as f:
+        return split_bom(f.read(4), coding)
+
+def skip_bom(blocks, coding):
+    '''去掉从头读取的字节块blocks中第一块开头与编码coding相符的BOM'''
+    blocks = iter(blocks)
+    for block in blocks:
+        yield block[len(split_bom(block, coding)[1]):]
+        break
+    for block in blocks:
+        yield block
+
+def expand_paths(patterns):
+    '''把文件名、目录（递归）和通配符展开成文件列表，去掉重复的文件'''
+    files = []
+    for p in patterns:
+        paths = [p] if os.path.exists(p) else sorted(glob.glob(p, recursive=True))
+        for path in paths:
+            if os.path.isdir(path):
+                for root, dirs, names in os.walk(path):
+                    dirs.sort()
+                    files.extend(os.path.join(root, i) for i in sorted(names))
+            else:
+                files.append(path)
+    seen = set()
+    return [i for i in files if not (i in seen or seen.add(i))]
+
+def plan_tasks(files, chunk_size):
+    '''把多个文件安排成任务，每个任务是[(文件名, 起始位置, 结束位置), ...]：
+    大文件按chunk_size分段，每段一个任务；小文件凑够chunk_size再合成一个任务'''
+    tasks, batch, batch_size = [], [], 0
+    for fn in files:
+        size = os.path.getsize(fn)
+        if size >= chunk_size and not detect_compression(fn):
+            tasks.extend([(fn, p1, min(p1 + chunk_size, size))]
+                         for p1 in range(0, size, chunk_size))
+            continue
+        batch.append((fn, 0, size))
+        batch_size += size
+        if batch_size >= chunk_size:
+            tasks.append(batch)
+            batch, batch_size = [], 0
+    if batch:
+        tasks.append(batch)
+    return tasks
+
+def char_ngrams(text, n):
+    '''统计text中的字n元组，不跨越空白；直接在整段文本上按切片计数，不为每行生成列表'''
+    size = len(text) - n + 1
+    c = Counter(map(text.__getitem__, map(slice, range(size), range(n, size + n))))
+    for k in [k for k in c if SPACE.search(k)]:
+        del c[k]
+    return c
+
+def word_ngrams(text, n):
+    '''统计text中的词n元组，不跨越行，词之间用空格连接'''
+    tokens = WORD_OR_NEWLINE.findall(text)
+    grams = zip(*[itertools.islice(tokens, i, None) for i in range(n)])
+    c = Counter(map(' '.join, grams))
+    for k in [k for k in c if '\n' in k]:
+        del c[k]
+    return c
+
+def encoded_newline(coding):
+    '''换行符在编码coding下的字节，不含BOM'''
+    encoder = codecs.getincrementalencoder(coding)()
+    encoder.encode('')  # 带BOM的编码会先输出BOM
+    return encoder.encode('\n')
+
+def align_line(mm, pos, coding):
+    '''把pos对齐到下一行的行首，按编码coding下换行符的字节及宽度查找'''
+    nl = encoded_newline(coding)
+    if len(nl) == 1:
+        return align_newline(mm, pos)
+    if pos <= 0:
+        return 0
+    i = mm.find(nl, pos - len(nl))
+    while i != -1 and i % len(nl):
+        i = mm.find(nl, i + 1)
+    return len(mm) if i == -1 else i + len(nl)
+
+def last_line_end(fn, coding):
+    '''返回文件fn中最后一个换行符之后的位置，之后还没写完的一行留到下次再统计'''
+    nl = encoded_newline(coding)
+    with open(fn, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return 0
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        i = mm.rfind(nl)
+        while i > 0 and i % len(nl):  # utf-16/32的换行符要按字符宽度对齐
+            i = mm.rfind(nl, 0, i)
+    finally:
+        mm.close()
+    return 0 if i == -1 else i + len(nl)
+
+def file_identity(fn, end, size=4096):
+    '''文件的标识：inode、大小、修改时间，以及开头和前end字节末尾各size字节的哈希值，
+    用于判断上次统计过的部分有没有被改动'''
+    st = os.stat(fn)
+    with open(fn, 'rb') as f:
+        head = hashlib.sha1(f.read(min(size, end))).hexdigest()
+        f.seek(max(end - size, 0))
+        tail = hashlib.sha1(f.read(min(size, end))).hexdigest()
+    return {'inode': st.st_ino, 'size': st.st_size, 'mtime': st.st_mtime,
+            'head': head, 'tail': tail}
+
+def format_counter(c, top=None):
+    '''把Counter按频数从高到低转成每行一个"字: 频数"的字符串，top为只取前几个'''
+    return '\n'.join(['{}: {}'.format(i, j) for i, j in c.most_common(top)])
+
+def detect_compression(fn):
+    '''根据文件头的魔数判断压缩格式，不是压缩文件时返回None'''
+    with open(fn, 'rb') as f:
+        head = f.read(6)
+    for fmt, (magic, _, _, _) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return fmt
+    return None
+
+def member_ranges(fn, fmt, chunk_size):
+    '''找出压缩文件中各成员（gzip的member、bz2的stream）的开头，按chunk_size把相邻
+    的成员合成一段，返回各段的(起始位置, 结束位置)'''
+    size = os.path.getsize(fn)
+    pattern = COMPRESSIONS[fmt][1]
+    if pattern is None or not size:
+        return [(0, size)]
+    with open(fn, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        starts = [0]
+        for m in pattern.finditer(mm, 1):
+            if m.start() - starts[-1] >= chunk_size:
+                starts.append(m.start())
+    finally:
+        mm.close()
+    return list(zip(starts, starts[1:] + [size]))
+
+def iter_decompress(f, size, fmt):
+    '''解压文件f当前位置起size字节内首尾相接的一个或多个成员，逐块生成解压后的数据；
+    这段数据没有恰好在成员末尾结束时抛出ValueError'''
+    new = COMPRESSIONS[fmt][2]
+    d, fresh = new(), True
+    while size > 0:
+        data = f.read(min(PIECE_SIZE, size))
+        if not data:
+            break
+        size -= len(data)
+        while data:
+            out = d.decompress(data)
+            fresh = False
+            if out:
+                yield out
+            if d.eof:  # 一个成员结束了，剩下的数据属于下一个成员
+                data = d.unused_data
+                d, fresh = new(), True
+            else:
+                data = b''
+    if not fresh:
+        raise ValueError('Truncated member: 压缩数据不完整')
+
+def boundary_rule(coding):
+    '''判断编码coding在任意字节处切分时，该用哪种规则找到字符边界：
+    'any'    单字节编码，任意位置都是字符边界
+    'utf8'   跳过10xxxxxx形式的后续字节
+    'utf16'/'utf32'  按2/4字节对齐（utf16还要跳过低位代理）
+    'low'    其他多字节编码（GBK、GB18030、Big5、Shift_JIS、EUC等），其后续字节都
+             不小于0x30，所以小于0x30的字节（空白、标点等）之后一定是字符边界
+    'newline' 有状态的编码（ISO-2022、UTF-7等）或没有明确字节序的utf-16/32，只能
+             按（该编码下的）换行符切分
+    '''
+    if coding in _rules:
+        return _rules[coding]
+    name = codecs.lookup(coding).name
+    if name in ('utf-8', 'utf-8-sig'):
+        rule = 'utf8'
+    elif name in ('utf-16-le', 'utf-16-be'):
+        rule = 'utf16'
+    elif name in ('utf-32-le', 'utf-32-be'):
+        rule = 'utf32'
+    elif name.startswith(('utf-', 'iso2022', 'hz')):
+        rule = 'newline'
+    else:
+        # 用增量解码器逐个字节试解码，有字节要等后续字节才能解出字符的就是多字节编码
+        decoder = codecs.getincrementaldecoder(coding)
+        rule = 'any'
+        for b in range(256):
+            try:
+                if not decoder().decode(bytearray([b]), False):
+                    rule = 'low'
+                    break
+            except UnicodeDecodeError:
+                pass
+    _rules[coding] = rule
+    return rule
+
+def align_char(mm, pos, coding):
+    '''把分段位置pos向后移到编码为coding的文件里最近的字符边界，与换行符无关，
+    所以只有一行的大文件也能分成多段并行统计'''
+    size = len(mm)
+    if pos <= 0:
+        return 0
+    if pos >= size:
+        return size
+    rule = boundary_rule(coding)
+    if rule == 'utf8':
+        while pos < size and 0x80 <= ord(mm[pos:pos+1]) < 0xc0:
+            pos += 1
+    elif rule == 'utf16':
+        pos += pos % 2
+        hi = pos + 1 if codecs.lookup(coding).name == 'utf-16-le' else pos
+        if hi < size and 0xdc <= ord(mm[hi:hi+1]) < 0xe0:  # 低位代理
+            pos += 2
+    elif rule == 'utf32':
+        pos += -pos % 4
+    elif rule == 'low':
+        m = LOW_BYTE.search(mm, pos - 1)
+        pos = size if m is None else m.end()
+    elif rule == 'newline':
+        pos = align_line(mm, pos, coding)
+    return min(pos, size)
     
 class WordCounter(object):
     def __init__(self, from_file, to_file=None, workers=None, coding=None,
-                    max_direct_read_size=10000000):
-        '''根据设定的进程数，把文件from_file分割成大小基本相同，数量等同与进程数的文件段，
-        来读取并统计词频，然后把结果写入to_file中，当其为None时直接打印在终端或命令行上。
+                    max_direct_read_size=10000000, use_mmap=True,
+                    block_size=BLOCK_SIZE, engine='regex', chunk_size=None,
+                    aggregate='pickle', per_file=False, incremental=False,
+                    mode='char', n=2, top=None, approx=False, max_memory=None,
+                    spill_dir=None, out_format='text', emit_partial=False,
+                    quiet=False, profile=None, backend=None, executor=None):
+        '''把文件from_file分割成固定大小的文件段，交给进程池里的进程，哪个进程空闲了
+        就领取下一段来读取并统计词频，然后把结果写入to_file中，当其为None时直接打印
+        在终端或命令行上。
         Args:
-        @from_file 要读取的文件
+        @from_file 要读取的文件，为'-'时读取标准输入，也可以是以二进制方式打开的
+                文件对象（见from_stream）；gzip、bz2、xz压缩文件会根据文件头自动识别，
+                多成员的gzip和bz2文件按成员分段并行解压统计，其他的边解压边统计；
+                为list或tuple时，其中可以是文件、目录（递归）和通配符，所有文件共用
+                一个进程池，小文件合成一个任务，大文件分段
         @to_file 结果要写入的文件
         @workers 进程数，为0时直接把文件一次性读入内存；为1时按for line in open(xxx)
-                读取；>=2时为多进程分段读取；默认为根据文件大小选择0或cpu数量的64倍
-        @coding 文件的编码方式，默认为采用chardet模块读取前1万个字符才自动判断
+                读取；>=2时为多进程分段读取；默认为根据文件大小选择0或不超过cpu数量
+                及分段数量的进程数
+        @coding 文件的编码方式，默认自动判断：在文件各处取样，先看是否为utf-8，
+                不是时才用chardet，结果按文件缓存（见charset.detect_file）
         @max_direct_read_size 直接读取的最大值，默认为10000000（约10M）
+        @use_mmap 是否用mmap映射文件并按大块解码统计，默认为True；为False时按行读取
+        @block_size 使用mmap时每次解码统计的块大小，默认为16M
+        @engine 统计引擎，'regex'为逐块正则去空白后用Counter统计；'vector'为用numpy
+                按码位数组做直方图统计，未安装numpy时自动退回'regex'
+        @chunk_size 多进程时每个文件段的大小，默认为根据文件大小和进程数自动选择
+        @aggregate 多进程统计结果的汇总方式，'pickle'为每段的Counter压缩后传回主进程；
+                'shm'为每个进程把计数直接加到共享内存中自己的计数槽里，主进程
+                只需把各槽相加，用到counter或result时才转成Counter
+        @per_file 统计多个文件时，是否同时保留每个文件各自的统计结果（file_counters）
+        @incremental 增量统计，用于只会往后追加内容的文件：统计到的位置、文件标识和
+                统计结果保存在结果文件旁的.checkpoint文件里，下次只统计新追加的
+                部分；文件被轮换或截断时自动重新全部统计
+        @mode 统计单位，'char'为单个字（空白不统计）；'word'为按空白和标点分出的词；
+                'ngram'为不跨越空白的字n元组；'word_ngram'为不跨越行的词n元组，
+                非'char'时engine和aggregate固定为'regex'和'pickle'
+        @n mode为'ngram'或'word_ngram'时的n，默认为2
+        @top 只输出频数最高的top个，默认为全部输出
+        @approx 近似统计频数最高的top个：每个进程和主进程都只保留固定数量的键
+                （SpaceSaving摘要），内存与不同键的数量无关，每个键的最大误差见
+                counter.error(key)，所有误差都不超过counter.floor
+        @max_memory 精确统计时每个进程中统计结果的内存上限（字节，按每个键约128字节
+                估算），超出时把统计结果按键排序写到磁盘上的临时文件里，最后由
+                主进程k路归并，默认为不限制
+        @spill_dir 存放上述临时文件的目录，默认为系统的临时目录
+        @out_format 结果文件的格式：'text'（每行"字: 频数"）、'tsv'、'jsonl'或'bin'
+                （struct打包的二进制格式，可用formats.read_bin读回），见
+                formats.write_counts；结果逐条写入文件，不在内存中拼接
+        @emit_partial 把结果写成按键排序的可合并的部分统计文件（见formats.write_partial），
+                用于分布式统计，多个这样的文件可用merge_partials（命令行中的
+                merge子命令）流式合并
+        @quiet 不显示进度；否则各进程把处理完的字节数累加到一个共享计数器上，由主
+                进程的一个线程定时显示总体进度、速度和剩余时间（见progress.Progress）
+        @profile 目录名，不为None时用cProfile分析主进程和每个子进程，分别写入该目录
+                下的parent.prof和worker-<进程号>.prof；各阶段的耗时和数据量不论是否
+                使用profile都会记录在self.stats中（见stats.Stats）
+        @backend 执行分段任务的方式：'process'进程池，'thread'线程池，'serial'在
+                主进程中依次执行，三者共用分段和合并的代码；为None时在自由线程的
+                CPython上或引擎释放GIL时用'thread'，否则用'process'
+        @executor 已经启动好的ProcessPoolExecutor，不为None且backend为'process'时
+                分段任务都交给它，不再每次新建进程池（见daemon.Server）；这时
+                设置随每个任务传给进程，不能共享进度计数器和共享内存，所以总是
+                quiet、aggregate='pickle'
         
         How to use:
         w = WordCounter('a.txt', 'b.txt')
         w.run()        
         '''
-        if not os.path.isfile(from_file):
+        self.stream = self.files = None
+        if from_file == '-':
+            from_file = getattr(sys.stdin, 'buffer', sys.stdin)
+        if hasattr(from_file, 'read'):
+            self.stream = from_file
+            self.f1 = getattr(from_file, 'name', '<stream>')
+            self.filesize = 0  # 流的大小要读完才知道
+        elif isinstance(from_file, (list, tuple)):
+            self.files = expand_paths(from_file)
+            if not self.files:
+                raise Exception('No such file: 文件不存在')
+            self.f1 = '{} files'.format(len(self.files))
+            self.filesize = sum(os.path.getsize(i) for i in self.files)
+        elif not os.path.isfile(from_file):
             raise Exception('No such file: 文件不存在')
-        self.f1 = from_file
-        self.filesize = os.path.getsize(from_file)
+        else:
+            self.f1 = from_file
+            self.filesize = os.path.getsize(from_file)
+        self.compression = None
+        if self.stream is None and self.files is None:
+            self.compression = detect_compression(self.f1)
         self.f2 = to_file
+        cpus = cpu_count() if workers is None else max(int(workers), 1)
+        if chunk_size:
+            self.chunk_size = int(chunk_size)
+        else:
+            self.chunk_size = auto_chunk_size(self.filesize, cpus)
+        chunks = -(-self.filesize // self.chunk_size)
         if workers is None:
-            if self.filesize < int(max_direct_read_size):
+            if self.stream is not None or self.compression:
+                self.workers = cpus
+            elif self.files is not None:  # 多个文件时按任务数决定进程数
+                self.workers = min(cpus, len(plan_tasks(self.files, 
+                                                        self.chunk_size)))
+                if self.workers == 1:
+                    self.workers = 0
+            elif self.filesize < int(max_direct_read_size):
                 self.workers = 0
             else:
-                self.workers = cpu_count() * 64 
+                self.workers = min(cpus, chunks)
+                if self.workers == 1:  # 单核或只有一段时，不必再开进程
+                    self.workers = 0
         else:
             self.workers = int(workers)
-        if coding is None:
-            try:
-                import chardet
-            except ImportError:
-                os.system('pip install chardet')
-                print('-'*70)
-                import chardet
-            with open(from_file, 'rb') as f:    
-                coding = chardet.detect(f.read(10000))['encoding']            
+        self.max_direct_read_size = int(max_direct_read_size)
+        self.use_mmap = use_mmap
+        self.block_size = int(block_size)
+        if engine not in ('regex', 'vector'):
+            raise ValueError('Unknown engine: {}'.format(engine))
+        self.engine = engine if np is not None else 'regex'
+        if aggregate not in ('pickle', 'shm'):
+            raise ValueError('Unknown aggregate: {}'.format(aggregate))
+        self.aggregate = aggregate if shared_memory is not None else 'pickle'
+        if mode not in MODES:
+            raise ValueError('Unknown mode: {}'.format(mode))
+        self.mode, self.n = mode, int(n)
+        if mode != 'char':  # 按码位的直方图和共享内存计数槽只适用于单个字
+            self.engine, self.aggregate = 'regex', 'pickle'
+        # 流的编码在读到第一块时再判断，多个文件时每个文件各自判断
+        self.bom = b''  # 开头的BOM，从其后开始统计，text格式的结果文件也带上
+        if self.stream is None and self.files is None:
+            coding, self.bom = file_coding(from_file, coding)
         self.coding = coding
-        self._c = Counter()
+        self.per_file = per_file
+        if incremental and (self.stream or self.files or self.compression):
+            raise ValueError('Incremental mode only supports a single plain file')
+        self.incremental = incremental
+        self.top = int(top) if top else None
+        if approx and (not self.top or incremental):
+            raise ValueError('Approx mode requires top and no incremental')
+        self.approx = approx
+        if approx:  # 共享内存计数槽只能做精确统计
+            self.aggregate = 'pickle'
+        backend = backend or default_backend(self.engine)
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend: {}'.format(backend))
+        self.backend = backend
+        if backend != 'process':  # 线程间直接共享结果，不需要共享内存
+            self.aggregate = 'pickle'
+        self.executor = executor
+        if executor is not None:
+            self.aggregate, quiet = 'pickle', True
+        if out_format not in FORMATS:
+            raise ValueError('Unknown format: {}'.format(out_format))
+        self.out_format = out_format
+        self.emit_partial = emit_partial
+        self.quiet = quiet
+        self.progress = None  # 最近一次统计的进度
+        self.profile = profile
+        if profile and not os.path.isdir(profile):
+            os.makedirs(profile)
+        self._done = None  # 显示进度时，所有进程共享的已处理字节数
+        self.spill_keys = None  # 统计结果的键数超过它时写到磁盘上
+        if max_memory and not approx:
+            self.spill_keys = max(int(max_memory) // KEY_BYTES, 1)
+            self.spill_dir = tempfile.mkdtemp(prefix='wordcounter_', dir=spill_dir)
+            weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+        # 要统计的范围，压缩文件的BOM在解压后的数据里
+        self.offset = 0 if self.compression else len(self.bom)
+        self.end = self.filesize
+        self.flush()
         
-    def run(self):
+    @classmethod
+    def from_stream(cls, fileobj, to_file=None, **kwargs):
+        '''从管道、标准输入或解压流等以二进制方式打开的文件对象中，按固定大小的块
+        读取并统计词频，内存占用与输入的总大小无关
+        
+        How to use:
+        w = WordCounter.from_stream(gzip.open('a.txt.gz'), 'b.txt')
+        w.run()
+        '''
+        return cls(fileobj, to_file, **kwargs)
+
+    def run(self, out=None):
+        '''统计并输出结果，没有to_file时结果和耗时等提示打印到out（默认为标准输出）'''
+        out = out or sys.stdout
         start = time.time()
-        if self.workers == 0:
-            self.count_direct(self.f1)
-        elif self.workers == 1:
-            self.count_single(self.f1, self.filesize)
+        profiler = cProfile.Profile() if self.profile else None
+        if profiler is not None:
+            profiler.enable()
+        probe = self._probe = Probe()
+        if self.incremental:
+            self.load_checkpoint()
+        if self.quiet:
+            self.count()
         else:
-            pool = Pool(self.workers)
-            res_list = []
-            for i in range(self.workers):
-                p1 = self.filesize * i // self.workers 
-                p2 = self.filesize * (i+1) // self.workers 
-                args = [self, self.f1, p1, p2, self.filesize]
-                res = pool.apply_async(func=wrap, args=args)
-                res_list.append(res)
-            pool.close()
-            pool.join()
-            self._c.update(reduce(operator.add, [r.get() for r in res_list]))            
+            total = None if self.stream is not None else self.end - self.offset
+            self.progress = Progress(total, self.f1)
+            self._done = self.progress.done
+            try:
+                with self.progress:
+                    self.count()
+            finally:
+                self._done = None
+        probe.lap()
+        self.finish_spill()
+        probe.lap('merge')
+        save_cache()
+        if self.incremental:
+            self.save_checkpoint()
+        probe.lap()
         if self.f2:
             with open(self.f2, 'wb') as f:
-                f.write(self.result.encode(self.coding))
+                self.write(f)
         else:
-            print(self.result)
+            result = self.result
+            for fn in (self.files or []):
+                if fn in self.file_counters:
+                    c = format_counter(self.file_counters[fn], self.top)
+                    result += '\n\n# {}\n{}'.format(fn, c)
+            print(result, file=out)
+        probe.lap('write')
+        self.stats.add(probe.record('<main>'))
+        self.stats.keys = None if self._runs else len(self.counter)
+        self.stats.wall = time.time() - start
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(self.profile, 'parent.prof'))
         cost = '{:.1f}'.format(time.time()-start)
         size = humansize(self.filesize)
-        tip = '\nFile size: {}. Workers: {}. Cost time: {} seconds'     
-        print(tip.format(size, self.workers, cost))
+        tip = ('\nFile size: {}. Workers: {}. Chunk size: {}. '
+               'Cost time: {} seconds')
+        print(tip.format(size, self.workers, humansize(self.chunk_size), cost),
+              file=out)
+        if self.approx:
+            tip = 'Approximate top {}: each count is over by at most {} of {}'
+            print(tip.format(self.top, self.counter.floor, self.counter.total),
+                  file=out)
         self.cost = cost + 's'
                 
+    def count(self):
+        '''按输入的类型选择统计方式'''
+        if self.stream is not None:
+            self.count_stream(self.stream)
+        elif self.files is not None:
+            self.count_corpus(self.files)
+        elif self.compression:
+            self.count_compressed_file(self.f1, self.compression)
+        elif self.workers == 0:
+            self.count_direct(self.f1)
+        elif self.workers == 1:
+            self.count_single(self.f1, self.filesize)
+        else:
+            tasks = [(self.f1, p1, min(p1 + self.chunk_size, self.end))
+                     for p1 in range(self.offset, self.end, self.chunk_size)]
+            n = max(min(self.workers, len(tasks)), 1)
+            initargs, shm = (), None
+            if self.aggregate == 'shm':
+                shm = shared_memory.SharedMemory(create=True, 
+                                                 size=n * BMP_SIZE * 8)
+                shm.buf[:] = bytes(shm.size)  # 部分系统上的共享内存不保证清零
+                initargs = (shm.name, Value('i', 0))
+            pool = self.pool(n, *initargs)
+            try:
+                # 哪个进程先算完就先合并哪个，合并与统计同时进行，且直接就地累加，
+                # 不再生成中间的Counter副本
+                for res in imap_unordered(pool, wrap, tasks, 2 * n):
+                    self.merge(unpack_counter(self.collect(res)))
+                    self._probe.lap('merge')
+                pool.shutdown()
+                if shm is not None:
+                    self._hist = add_hist(self._hist, sum_slots(shm, n))
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+
+    def count_stream(self, stream, raw=None):
+        '''流式统计：读取、解码、统计串成生成器流水线，多进程时已读未统计的块最多
+        只保留进程数的2倍，超出时先等最早的块统计完；stream是压缩文件raw的解压
+        流时，进度按读取的压缩数据计'''
+        first = stream.read(self.block_size)
+        if self.coding is None:
+            self.coding = detect_coding(first) or 'utf-8'
+        self.coding, self.bom = split_bom(first, self.coding)
+        first = first[len(self.bom):]
+        self.chunk_size = self.block_size
+        blocks = itertools.chain(
+            [first], iter(lambda: stream.read(self.block_size), b''))
+        texts = self.whole_texts(iter_texts(self.tally(blocks, raw), 
+                                            self.coding))
+        probe = self._probe
+        if self.workers < 2:
+            for text in texts:
+                probe.lap()
+                c = self.parse_text(text)
+                probe.lap('parse')
+                self.merge(c)
+                probe.lap('merge')
+                probe['lines'] += text.count('\n')
+            return
+        pool = self.pool(self.workers)
+        pending = deque()
+        try:
+            for text in texts:
+                if len(pending) >= 2 * self.workers:
+                    res = self.collect(pending.popleft().result())
+                    self.merge(unpack_counter(res))
+                    probe.lap('merge')
+                pending.append(pool.submit(wrap_text, text))
+            while pending:
+                res = self.collect(pending.popleft().result())
+                self.merge(unpack_counter(res))
+                probe.lap('merge')
+            pool.shutdown()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def count_corpus(self, files):
+        '''统计多个文件：所有文件共用一个进程池，按plan_tasks安排的任务统计'''
+        tasks = plan_tasks(files, self.chunk_size)
+        if self.workers < 2:
+            results = (self.count_files(i) for i in tasks)
+        else:
+            n = min(self.workers, len(tasks))
+            pool = self.pool(n)
+            results = (((fn, unpack_counter(packed)) 
+                        for fn, packed in self.collect(res))
+                       for res in imap_unordered(pool, wrap_files, tasks, 2 * n))
+        try:
+            for res in results:
+                for fn, c in res:
+                    self.merge(c)
+                    if self.per_file:
+                        if fn not in self.file_counters:
+                            self.file_counters[fn] = self.new_counter()
+                        self.file_counters[fn].update(c)
+                self._probe.lap('merge')
+        finally:
+            if self.workers >= 2:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def count_files(self, segments):
+        '''统计多个文件段[(文件名, 起始位置, 结束位置), ...]，返回[(文件名, 词频), ...]；
+        未指定编码时每个文件各自判断编码，压缩文件整个解压统计'''
+        coding, res = self.coding, []
+        try:
+            for fn, p1, p2 in segments:
+                self.coding = file_coding(fn, coding)[0]
+                fmt = detect_compression(fn) if p2 else None
+                if fmt:
+                    c = self.new_counter()
+                    self._probe.lap()
+                    with COMPRESSIONS[fmt][3](fn, 'rb') as f:
+                        blocks = iter(lambda: f.read(self.block_size), b'')
+                        texts = iter_texts(skip_bom(blocks, self.coding), 
+                                           self.coding)
+                        for text in self.whole_texts(texts):
+                            c.update(self.parse_text(text))
+                    self._probe.lap('parse')  # 解压、解码和统计交织在一起，都计入parse
+                    self._probe['bytes'] += p2
+                    if self._done is not None:
+                        report(self._done, p2)
+                else:
+                    c = self.count_mmap(fn, p1, p2, os.path.getsize(fn))
+                res.append((fn, c))
+        finally:
+            self.coding = coding
+        return res
+
+    def count_compressed_file(self, fn, fmt):
+        '''统计压缩文件：能按成员分成多段时多进程各自解压统计一段，再由主进程把
+        各段交界处被截断的字拼起来统计；否则边解压边统计。utf-16/32等编码的字有
+        固定宽度，成员的交界不一定落在字的边界上，所以也不分段'''
+        ranges = []
+        if self.workers > 1 and boundary_rule(self.coding) in ('any', 'utf8', 'low'):
+            ranges = member_ranges(fn, fmt, self.chunk_size)
+        if len(ranges) > 1:
+            c, heads, tails = self.new_counter(), {}, {}
+            n = min(self.workers, len(ranges))
+            pool = self.pool(n)
+            try:
+                tasks = [(fn, fmt, p1, p2) for p1, p2 in ranges]
+                results = imap_unordered(pool, wrap_compressed, tasks, 2 * n)
+                for p1, res in map(self.collect, results):
+                    if res is None:
+                        break
+                    c.update(unpack_counter(res[0]))
+                    self._probe.lap('merge')
+                    heads[p1], tails[p1] = res[1], res[2]
+                else:
+                    pool.shutdown()
+                    for (p1, _), (p2, _) in zip(ranges, ranges[1:]):
+                        joint = tails[p1] + heads[p2]
+                        c.update(self.parse_text(joint.decode(self.coding)))
+                    self.merge(c)
+                    return
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+        size = self.filesize
+        if self._done is not None:  # 并行解压失败时已经计入的进度作废
+            self._done.value = 0
+        with open(fn, 'rb') as raw, COMPRESSIONS[fmt][3](raw, 'rb') as f:
+            self.count_stream(f, raw)
+        self.filesize = size
+
+    def count_compressed(self, fn, fmt, p1, p2):
+        '''解压并统计压缩文件[p1, p2)中的成员，返回(词频, 开头被截断的字或词的后半
+        部分, 结尾被截断的字或词的前半部分)，后两者由主进程与相邻的段拼接后统计'''
+        c = self.new_counter()
+        self._probe.lap()
+        decoder = codecs.getincrementaldecoder(self.coding)()
+        with open(fn, 'rb') as f:
+            f.seek(p1)
+            blocks = iter_decompress(f, p2 - p1, fmt)
+            head, rest = b'', ''
+            if p1:
+                for block in blocks:
+                    head += block
+                    if self.align(head, 1) < len(head):
+                        break
+                k = self.align(head, 1)
+                head, first = head[:k], head[k:]
+                blocks = itertools.chain([first], blocks)
+            else:
+                blocks = skip_bom(blocks, self.coding)
+            for block in blocks:
+                text, rest = self.split_tail(rest + decoder.decode(block))
+                c.update(self.parse_text(text))
+        self._probe.lap('parse')
+        self._probe['bytes'] += p2 - p1
+        if self._done is not None:
+            report(self._done, p2 - p1)
+        return c, head, rest.encode(self.coding) + decoder.getstate()[0]
+
+    @property
+    def checkpoint(self):  #增量统计的checkpoint文件
+        return (self.f2 or self.f1) + '.checkpoint'
+
+    def load_checkpoint(self):
+        '''读取上次增量统计的checkpoint：文件没被轮换或截断、已统计的部分也没变时，
+        载入上次的统计结果，只统计之后追加的部分；否则从头统计'''
+        self.offset = len(self.bom)
+        self.end = last_line_end(self.f1, self.coding)
+        if not os.path.isfile(self.checkpoint):
+            return
+        with open(self.checkpoint, 'rb') as f:
+            ckpt = json.loads(f.read().decode('utf-8'))
+        old, new = ckpt['identity'], file_identity(self.f1, ckpt['offset'])
+        if (ckpt.get('version') == 1 and ckpt['coding'] == self.coding and
+                ckpt['offset'] <= self.end and
+                all(old[k] == new[k] for k in ('inode', 'head', 'tail'))):
+            self.offset = ckpt['offset']
+            self._c.update(ckpt['counter'])
+        else:
+            print('File changed, recount from the beginning: 文件已变动，重新统计')
+
+    def save_checkpoint(self):
+        '''保存统计到的位置、文件标识和统计结果，先写临时文件再替换，避免写了一半'''
+        ckpt = {'version': 1, 'offset': self.end, 'coding': self.coding,
+                'identity': file_identity(self.f1, self.end),
+                'counter': self.counter}
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(ckpt, ensure_ascii=False).encode('utf-8'))
+        os.replace(tmp, self.checkpoint)
+
+    def pool(self, n, *initargs):
+        '''按backend新建有n个进程（或线程）的执行器，每个进程启动时收到一次统计用的
+        设置；各种执行器都只用submit和shutdown，分段和合并的代码是同一套；
+        有常驻的进程池self.executor时借用它'''
+        if self.executor is not None and self.backend == 'process':
+            return JobExecutor(self.executor, self.worker_options())
+        executor = {'process': ProcessPoolExecutor, 'thread': ThreadPoolExecutor,
+                    'serial': SerialExecutor}[self.backend]
+        return executor(n, initializer=init_worker, 
+                        initargs=(self.worker_options(),) + initargs)
+
+    def collect(self, result):
+        '''收下子进程传回的(结果, 任务记录)：记录存入self.stats，返回结果，
+        之后到下一次lap的时间计为主进程合并结果的耗时'''
+        res, record = result
+        self.stats.add(record)
+        self._probe.lap()
+        return res
+
+    def tally(self, blocks, raw=None):
+        '''累计已读取的字节数，流读完后self.filesize即为其总大小'''
+        done, pos, probe = self._done, 0, self._probe
+        probe.lap()
+        for block in blocks:
+            probe.lap('read')
+            self.filesize += len(block)
+            probe['bytes'] += len(block)
+            if done is not None:
+                n = raw.tell() - pos if raw is not None else len(block)
+                report(done, n)
+                pos += n
+            yield block
+            probe.lap()
+
     def count_single(self, from_file, f_size):
-        '''单进程读取文件并统计词频'''
-        start = time.time()
+        '''单进程读取文件并统计词频；换行符不止一个字节的编码（utf-16/32）不能
+        按字节逐行读取，改用mmap分块统计'''
+        if len(encoded_newline(self.coding)) > 1:
+            self.merge(self.count_mmap(from_file, self.offset, self.end, f_size))
+            return
+        done, last, lines = self._done, self.offset, 0
+        batch = Counter()  # 逐行先精确计数，每STEP字节才并入总结果一次
+        self._probe.lap()
         with open(from_file, 'rb') as f:
-            for line in f:
-                self._c.update(self.parse(line))
-                processbar(f.tell(), f_size, from_file, f_size, start)   
+            f.seek(self.offset)
+            for lines, line in enumerate(f, 1):
+                pos = f.tell()
+                if pos > self.end:  # 增量统计时最后没写完的一行
+                    break
+                batch.update(self.parse(line))
+                if pos - last >= STEP:
+                    self.merge(batch)
+                    batch = Counter()
+                    if done is not None:
+                        report(done, pos - last)
+                    last = pos
+        self.merge(batch)
+        # 逐行处理时不分开计时，读取、解码和统计都计入parse
+        self._probe.lap('parse')
+        self._probe.update(bytes=self.end - self.offset, lines=lines)
+        if done is not None:
+            report(done, self.end - last)
 
     def count_direct(self, from_file):
         '''直接把文件内容全部读进内存并统计词频'''
-        start = time.time()
+        if self.use_mmap and self.filesize > self.max_direct_read_size:
+            # 文件太大时不一次性读入内存，改为mmap分块统计
+            self.merge(self.count_mmap(from_file, self.offset, self.end, 
+                                       self.filesize))
+            return
+        probe = self._probe
+        probe.lap()
         with open(from_file, 'rb') as f:
-            line = f.read()
-        self._c.update(self.parse(line))  
+            f.seek(self.offset)
+            data = f.read(self.end - self.offset)
+        probe.lap('read')
+        text = data.decode(self.coding)
+        probe.lap('decode')
+        c = self.parse_text(text)
+        probe.lap('parse')
+        self.merge(c)
+        probe.lap('merge')
+        probe.update(bytes=len(data), lines=text.count('\n'))
+        if self._done is not None:
+            report(self._done, self.end - self.offset)
+                
+    def count_mmap(self, fn, p1, p2, f_size):
+        '''用mmap映射文件，把分段的边界对齐到字符边界，再以大块为单位解码并统计词频，
+        不再逐行读取和调用tell()'''
+        c, hist, runs = self.new_counter(), None, Runs()
+        if not f_size:  # 空文件无法映射
+            return c
+        with open(fn, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # 第一段从offset（BOM或上次增量统计之后）开始，不用对齐
+            pos = p1 if p1 == self.offset else self.align(mm, p1)
+            end = self.align(mm, p2)
+            if pos == 0:  # 多个文件时各文件开头的BOM
+                pos = len(split_bom(mm[:4], self.coding)[1])
+            probe = self._probe
+            while pos < end:
+                nxt = min(self.align(mm, pos + self.block_size), end)
+                probe.lap()
+                data = mm[pos:nxt]
+                probe.lap('read')
+                text = data.decode(self.coding)
+                probe.lap('decode')
+                probe.update(bytes=nxt - pos, lines=text.count('\n'))
+                if self.engine == 'vector':
+                    hist = add_hist(hist, codepoint_hist(text))
+                    probe.lap('parse')
+                else:
+                    part = self.parse_text(text)
+                    probe.lap('parse')
+                    c.update(part)
+                    probe.lap('update')
+                    if self.spill_keys and len(c) > self.spill_keys:
+                        runs.append(write_run(c, self.spill_dir))
+                        c = self.new_counter()
+                if self._done is not None:
+                    report(self._done, nxt - pos)
+                pos = nxt
+        finally:
+            mm.close()
+        if self.engine == 'vector':
+            return hist_to_counter(hist)
+        if runs:  # 写过磁盘的，剩下的也写到磁盘上，只把文件名传回
+            runs.append(write_run(c, self.spill_dir))
+            return runs
+        return c
                 
     def count_multi(self, fn, p1, p2, f_size):  
-        c = Counter()
+        if self.use_mmap or len(encoded_newline(self.coding)) > 1:
+            return self.count_mmap(fn, p1, p2, f_size)
+        c = self.new_counter()
         with open(fn, 'rb') as f:    
-            if p1:  # 为防止字被截断的，分段处所在行不处理，从下一行开始正式处理
+            if p1 > self.offset:  # 为防止字被截断的，分段处所在行不处理，从下一行开始正式处理
                 f.seek(p1-1)
                 while b'\n' not in f.read(1):
                     pass
-            start = time.time()
+            else:
+                f.seek(p1)
+            done, last, lines = self._done, p1, 0
+            batch = Counter()  # 近似统计时逐行更新摘要太慢，先精确计数一批行
+            self._probe.lap()
             while 1:                           
                 line = f.readline()
-                c.update(self.parse(line))   
+                batch.update(self.parse(line))   
+                lines += 1
                 pos = f.tell()  
-                if p1 == 0: #显示进度
-                    processbar(pos, p2, fn, f_size, start)
+                if pos - last >= STEP:
+                    c.update(batch)
+                    batch = Counter()
+                    if done is not None:
+                        report(done, min(pos, p2) - last)
+                    last = min(pos, p2)
                 if pos >= p2:               
+                    c.update(batch)
+                    if done is not None:
+                        report(done, p2 - last)
+                    self._probe.lap('parse')  # 逐行处理时都计入parse
+                    self._probe.update(bytes=p2 - p1, lines=lines)
                     return c      
                     
     def parse(self, line):  #解析读取的文件流
-        return Counter(re.sub(r'\s+','',line.decode(self.coding)))
+        return self.parse_text(line.decode(self.coding))
+
+    def parse_text(self, text):  #统计解码后的字符串
+        if self.mode == 'word':
+            return Counter(WORD.findall(text))
+        if self.mode == 'ngram':
+            return char_ngrams(text, self.n)
+        if self.mode == 'word_ngram':
+            return word_ngrams(text, self.n)
+        if self.engine == 'vector':
+            return hist_to_counter(codepoint_hist(text))
+        return Counter(re.sub(r'\s+','',text))
         
+    def align(self, mm, pos):
+        '''把分段位置pos向后对齐到字符边界；按词或字n元组统计时还要对齐到空白处，
+        按词n元组统计时对齐到行首，以免词或n元组被截断'''
+        pos = align_char(mm, pos, self.coding)
+        if self.mode == 'char' or pos in (0, len(mm)):
+            return pos
+        if (self.mode == 'word_ngram' or 
+                boundary_rule(self.coding) not in ('any', 'utf8', 'low')):
+            return align_line(mm, pos, self.coding)
+        m = SPACE_BYTE.search(mm, pos - 1)
+        return len(mm) if m is None else m.end()
+
+    def split_tail(self, text):
+        '''把文本末尾可能被截断的词或行分出来，留到与下一段文本拼接后再统计'''
+        if self.mode == 'char':
+            return text, ''
+        i = text.rfind('\n') if self.mode == 'word_ngram' else max(
+                text.rfind(i) for i in SPACE_CHARS)
+        return text[:i+1], text[i+1:]
+
+    def whole_texts(self, texts):
+        '''逐段生成文本，保证词或行不会被分到两段里'''
+        rest = ''
+        for text in texts:
+            text, rest = self.split_tail(rest + text)
+            if text:
+                yield text
+        if rest:
+            yield rest
+
+    def merge(self, c):
+        '''把一段的统计结果并入总结果，总结果的键数超过spill_keys时写到磁盘上'''
+        if isinstance(c, Runs):
+            self._runs.extend(c)
+            return
+        self._c.update(c)
+        if self.spill_keys and len(self._c) > self.spill_keys:
+            self._runs.append(write_run(self._c, self.spill_dir))
+            self._c = self.new_counter()
+
+    def finish_spill(self):
+        '''统计结束后，把所有写到磁盘上的统计结果连同内存中剩下的归并成一个文件'''
+        if not self._runs:
+            return
+        if self._hist is not None:
+            self._c.update(hist_to_counter(self._hist))
+            self._hist = None
+        if self._c:
+            self._runs.append(write_run(self._c, self.spill_dir))
+            self._c = self.new_counter()
+        self._runs[:] = [merge_runs(self._runs, self.spill_dir)]
+
+    def most_common(self, top=None):
+        '''按频数从高到低逐个生成(键, 频数)；结果在磁盘上时用外部排序，
+        有top时用heapq.nlargest，都不必把全部结果读进内存'''
+        if not self._runs:
+            return iter(self.counter.most_common(top))
+        if top:
+            return iter(heapq.nlargest(top, read_run(self._runs[0]), 
+                                       key=lambda x: x[1]))
+        return most_common_run(read_run(self._runs[0]), self.spill_dir, 
+                               self.spill_keys)
+
+    def sorted_items(self):
+        '''按键的顺序逐个生成(键, 频数)'''
+        if self._runs:
+            return read_run(self._runs[0])
+        return iter(sorted(self.counter.items()))
+
+    def partial_meta(self):
+        '''部分统计文件中记录的统计设置，只有设置相同的文件才能合并'''
+        return {'mode': self.mode, 'n': self.n if self.mode != 'char' else None,
+                'approx': self.approx}
+
+    def write(self, f):
+        '''把统计结果（有top时只取前top个）按out_format逐条写入以二进制方式打开的
+        文件f，per_file时再逐个写入每个文件各自的结果'''
+        coding = self.coding or 'utf-8'
+        if self.emit_partial:
+            write_partial(f, self.sorted_items(), self.partial_meta())
+            return
+        if self.out_format == 'text':
+            f.write(self.bom)
+        write_counts(f, self.most_common(self.top), self.out_format, coding)
+        for fn in (self.files or []):
+            if fn in self.file_counters:
+                items = self.file_counters[fn].most_common(self.top)
+                write_counts(f, items, self.out_format, coding, fn)
+
+    def worker_options(self):
+        '''子进程统计时需要的设置，不包括已有的统计结果self._c'''
+        return dict((k, v) for k, v in self.__dict__.items() if k not in 
+                    ('_c', '_hist', '_runs', 'stream', 'files', 'file_counters',
+                     'progress', 'stats', '_probe', 'executor'))
+
+    def new_counter(self):
+        '''新建存放统计结果的容器：精确统计用Counter，近似统计用大小固定的SpaceSaving'''
+        if self.approx:
+            return SpaceSaving(self.top * APPROX_FACTOR)
+        return Counter()
+
     def flush(self):  #清空统计结果
-        self._c = Counter()
+        self._c = self.new_counter()
+        self._hist = None  # 共享内存汇总得到的码位直方图，用到时才并入self._c
+        for path in getattr(self, '_runs', []):
+            os.remove(path)
+        self._runs = Runs()  # 超出内存上限时写到磁盘上的统计结果
+        self.file_counters = {}  # per_file时每个文件各自的统计结果
+        self.stats = Stats()  # 各阶段的耗时和数据量
+        self._probe = Probe()  # 当前任务的计时
 
     @property
-    def counter(self):  #返回统计结果的Counter类       
+    def counter(self):  #返回统计结果的Counter类，结果在磁盘上时会全部读进内存
+        if self._runs:
+            self.finish_spill()
+            path = self._runs.pop()
+            self._c.update(dict(read_run(path)))
+            os.remove(path)
+        if self._hist is not None:
+            self._c.update(hist_to_counter(self._hist))
+            self._hist = None
         return self._c
                     
     @property
     def result(self):  #返回统计结果的字符串型式，等同于要写入结果文件的内容
-        ss = ['{}: {}'.format(i, j) for i, j in self._c.most_common()]
+        ss = ['{}: {}'.format(i, j) for i, j in self.most_common(self.top)]
         return '\n'.join(ss)
         
+def merge_partials(paths, to_file=None, workers=None, out_format='text',
+                   top=None, emit_partial=False, spill_dir=None):
+    '''流式合并多个部分统计文件（map/reduce中的reduce），把结果写入to_file，当其为
+    None时直接打印在终端或命令行上。文件很多时先分成workers组，多进程各自归并
+    一组，再归并各组的结果；输出按频数排序时用外部排序，内存占用与键的数量无关
+    
+    How to use:
+    merge_partials(['a.cnt', 'b.cnt'], 'c.txt')
+    '''
+    metas = []
+    for p in paths:
+        with open(p, 'rb') as f:
+            metas.append(read_partial_meta(f))
+    if any(i != metas[0] for i in metas):
+        raise ValueError('Partial files were counted with different settings')
+    workers = cpu_count() if workers is None else int(workers)
+    dirname = tempfile.mkdtemp(prefix='wordcounter_', dir=spill_dir)
+    try:
+        if workers > 1 and len(paths) > workers:
+            groups = [(paths[i::workers], dirname, metas[0]) 
+                      for i in range(workers)]
+            with ProcessPoolExecutor(workers) as pool:
+                paths = list(pool.map(wrap_merge, groups))
+        items = merge_sorted([read_partial(p) for p in paths])
+        out = open(to_file, 'wb') if to_file else getattr(sys.stdout, 'buffer', 
+                                                          sys.stdout)
+        try:
+            if emit_partial:
+                write_partial(out, items, metas[0])
+            elif top:
+                write_counts(out, heapq.nlargest(int(top), items, 
+                                                 key=lambda x: x[1]), out_format)
+            else:
+                write_counts(out, most_common_run(items, dirname, SORT_KEYS), 
+                             out_format)
+        finally:
+            if to_file:
+                out.close()
+            else:
+                out.flush()
+    finally:
+        shutil.rmtree(dirname, True)
+
+def parse_args(argv, cwd=None):
+    '''把命令行参数argv（不含程序名）解析成(from_file, to_file, WordCounter的其他
+    参数, 是否打印stats)；cwd不为None时（常驻服务收到的请求）把其中的相对路径都
+    换成cwd下的路径'''
+    path = (lambda p: os.path.join(cwd, p)) if cwd else (lambda p: p)
+    files = [i if i == '-' else path(i) for i in argv if not i.startswith('--')]
+    from_file, to_file = (files + [None])[:2]
+    args = {'coding' : None, 'workers': None, 'max_direct_read_size':10000000,
+            'chunk_size': None, 'mode': 'char', 'n': 2, 'top': None,
+            'max_memory': None, 'spill_dir': None, 'out_format': 'text',
+            'profile': None, 'backend': None}
+    for i in argv:
+        for k in args:
+            if re.match(r'(--)?{}=(.+)'.format(k), i):
+                args[k] = re.findall(r'{}=(.+)'.format(k), i)[0]
+    output = [path(i.split('=', 1)[1]) for i in argv if i.startswith('--output=')]
+    if output or len(files) > 2:  # 多个输入时，结果文件由--output指定
+        from_file, to_file = files, (output or [None])[0]
+    elif from_file != '-' and not os.path.isfile(from_file):  # 目录或通配符
+        from_file = [from_file]
+    args['per_file'] = '--per_file' in argv
+    args['incremental'] = '--incremental' in argv
+    args['approx'] = '--approx' in argv
+    args['emit_partial'] = '--emit_partial' in argv
+    args['quiet'] = '--quiet' in argv
+    if '--profile' in argv:
+        args['profile'] = 'profile'
+    for k in ('spill_dir', 'profile'):
+        if args[k]:
+            args[k] = path(args[k])
+    stats = [i.split('=', 1)[1] for i in argv if i.startswith('--stats=')]
+    if stats and stats[0] != 'json':
+        raise ValueError('Unknown stats format: {}'.format(stats[0]))
+    if args['max_memory']:
+        args['max_memory'] = parsesize(args['max_memory'])
+    return from_file, to_file, args, bool(stats)
+
 def main():
+    if sys.argv[1:2] == ['serve']:
+        from daemon import serve
+        serve(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['merge']:
+        opts = dict(i[2:].split('=', 1) for i in sys.argv[2:] if '=' in i)
+        merge_partials([i for i in sys.argv[2:] if not i.startswith('--')],
+                       opts.get('output'), opts.get('workers'), 
+                       opts.get('out_format', 'text'), opts.get('top'),
+                       '--emit_partial' in sys.argv, opts.get('spill_dir'))
+        return
     if len(sys.argv) < 2:
         print('Usage: python wordcounter.py from_file to_file')
+        print('       cat from_file | python wordcounter.py - to_file')
+        print('       python wordcounter.py --output=to_file [--per_file] '
+              'file_or_dir_or_glob ...')
+        print('       python wordcounter.py merge --output=to_file a.cnt b.cnt ...')
+        print('       python wordcounter.py serve [--workers=4] [--max_jobs=4]')
         exit(1)
-    from_file, to_file = sys.argv[1:3]
-    args = {'coding' : None, 'workers': None, 'max_direct_read_size':10000000}
-    for i in sys.argv:
-        for k in args:
-            if re.search(r'{}=(.+)'.format(k), i):
-                args[k] = re.findall(r'{}=(.+)'.format(k), i)[0]
-
+    if '--no_daemon' not in sys.argv and '-' not in sys.argv:
+        # 有常驻服务在运行时，把命令行转给它统计
+        from daemon import forward
+        res = forward(sys.argv[1:])
+        if res is not None:
+            if 'error' in res:
+                print(res['error'], file=sys.stderr)
+                exit(1)
+            sys.stdout.write(res['output'])
+            if 'stats' in res:
+                print(json.dumps(res['stats'], ensure_ascii=False, sort_keys=True))
+            return
+    from_file, to_file, args, stats = parse_args(sys.argv[1:])
     w = WordCounter(from_file, to_file, **args)
     w.run()
+    if stats:
+        print(w.stats.to_json())
     
 if __name__ == '__main__':
     main()